@@ -1,4 +1,4 @@
 from .mxl import MXL
 
 def setup(bot):
-    bot.add_cog(MXL())
\ No newline at end of file
+    bot.add_cog(MXL(bot))
\ No newline at end of file
@@ -0,0 +1,265 @@
+import collections
+from html.parser import HTMLParser
+from .classifier import ItemFeatures
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+class _Element:
+    __slots__ = ('tag', 'start', 'waiting')
+
+    def __init__(self, tag, start):
+        self.tag = tag
+        self.start = start
+        self.waiting = None
+
+class _Wrapper:
+    __slots__ = ('depth', 'grandparent', 'text', 'font', 'span', 'grey', 'color', 'open_fields', 'font_br', 'span_br')
+
+    def __init__(self, depth, grandparent):
+        self.depth = depth
+        self.grandparent = grandparent
+        self.text = []
+        self.font = None
+        self.span = None
+        self.grey = None
+        self.color = ''
+        self.open_fields = {}
+        self.font_br = None
+        self.span_br = None
+
+class _PendingItem:
+    __slots__ = ('features', 'cut', 'done')
+
+    def __init__(self, features, cut, done):
+        self.features = features
+        self.cut = cut
+        self.done = done
+
+class ArmoryPage:
+    """
+    A downloaded character page.
+
+    `unchanged` pages (the armory answered 304 or the fingerprint matched the snapshot) and `failed` ones (any other
+    status than 200) aren't parsed and have no items.
+    """
+
+    __slots__ = ('status', 'fingerprint', 'etag', 'last_modified', 'unchanged', 'login_form', 'heading', 'items')
+
+    def __init__(self, status=200, fingerprint=None, etag=None, last_modified=None, unchanged=False):
+        self.status = status
+        self.fingerprint = fingerprint
+        self.etag = etag
+        self.last_modified = last_modified
+        self.unchanged = unchanged
+        self.login_form = False
+        self.heading = None
+        self.items = []
+
+    @property
+    def failed(self):
+        return not self.unchanged and self.status != 200
+
+    @property
+    def private(self):
+        return 'not allowed' in (self.heading or '')
+
+class ArmoryPageParser(HTMLParser):
+    """
+    Streaming parser for the armory's char.php pages.
+
+    Yields one ItemFeatures record per `.item-wrapper` without building a document tree. The raw HTML of an item
+    (its wrapper's grandparent, the element the tooltip images are rendered from) is only sliced out when `wants_html`
+    returns True for the item's color class. Without `wants_html` the already parsed source is dropped as the page is fed,
+    so feeding it in chunks keeps memory flat.
+    """
+
+    def __init__(self, wants_html=None):
+        super().__init__()
+        self.login_form = False
+        self.heading = None
+        self._wants_html = wants_html
+        self._source = ''
+        self._source_start = 0
+        self._line_starts = [0]
+        self._fed = 0
+        self._stack = []
+        self._wrapper = None
+        self._heading_depth = None
+        self._heading_text = []
+        self._ready = collections.deque()
+
+    def feed(self, data):
+        newline = data.find('\n')
+        while newline != -1:
+            self._line_starts.append(self._fed + newline + 1)
+            newline = data.find('\n', newline + 1)
+
+        self._fed += len(data)
+        self._source += data
+        super().feed(data)
+        self._trim()
+
+    def close(self):
+        super().close()
+        # Whatever is still open at the end of the page ends there.
+        for element in self._stack:
+            for pending in element.waiting or ():
+                pending.features.html = self._slice(element.start, self._fed, pending.cut)
+                pending.done = True
+
+            element.waiting = None
+
+    def items(self):
+        """Pops the records that are complete, in page order."""
+
+        while self._ready and self._ready[0].done:
+            yield self._ready.popleft().features
+
+    def handle_starttag(self, tag, attrs):
+        start = self._offset()
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if attrs.get('action') == 'login.php':
+            self.login_form = True
+
+        if tag == 'h1' and self.heading is None and self._heading_depth is None:
+            self._heading_depth = len(self._stack)
+
+        wrapper = self._wrapper
+        if wrapper is not None:
+            end = start + len(self.get_starttag_text())
+            if tag == 'br':
+                if wrapper.font is not None and 'font' in wrapper.open_fields and wrapper.font_br is None:
+                    wrapper.font_br = (start, end)
+                if wrapper.span is not None and 'span' in wrapper.open_fields and wrapper.span_br is None:
+                    wrapper.span_br = (start, end)
+
+            if tag == 'font' and wrapper.font is None:
+                wrapper.font = []
+                wrapper.open_fields['font'] = len(self._stack)
+            if tag == 'span' and wrapper.span is None:
+                wrapper.span = []
+                wrapper.color = classes[0] if classes else ''
+                wrapper.open_fields['span'] = len(self._stack)
+            if 'color-grey' in classes and wrapper.grey is None:
+                wrapper.grey = []
+                wrapper.open_fields['grey'] = len(self._stack)
+
+        if tag in VOID_ELEMENTS:
+            self._close_fields(len(self._stack))
+            return
+
+        if wrapper is None and 'item-wrapper' in classes and len(self._stack) >= 2:
+            self._wrapper = _Wrapper(len(self._stack), self._stack[-2])
+
+        self._stack.append(_Element(tag, start))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index].tag == tag:
+                break
+        else:
+            return
+
+        start = self._offset()
+        end = self._source.find('>', start - self._source_start) + 1 + self._source_start
+        while len(self._stack) > index:
+            element = self._stack.pop()
+            depth = len(self._stack)
+            self._close_fields(depth)
+            if self._heading_depth == depth:
+                self.heading = ''.join(self._heading_text)
+                self._heading_depth = None
+
+            if self._wrapper is not None and self._wrapper.depth == depth:
+                self._finish_wrapper()
+
+            if element.waiting:
+                for pending in element.waiting:
+                    pending.features.html = self._slice(element.start, end, pending.cut)
+                    pending.done = True
+
+                element.waiting = None
+
+    def handle_data(self, data):
+        if self._heading_depth is not None:
+            self._heading_text.append(data)
+
+        wrapper = self._wrapper
+        if wrapper is None:
+            return
+
+        wrapper.text.append(data)
+        for field in wrapper.open_fields:
+            getattr(wrapper, field).append(data)
+
+    def _close_fields(self, depth):
+        if self._wrapper is None:
+            return
+
+        for field, field_depth in list(self._wrapper.open_fields.items()):
+            if field_depth >= depth:
+                del self._wrapper.open_fields[field]
+
+    def _finish_wrapper(self):
+        wrapper = self._wrapper
+        self._wrapper = None
+        name = ''.join(wrapper.font if wrapper.font is not None else wrapper.span or [])
+        features = ItemFeatures(
+            name=name,
+            color=wrapper.color,
+            text=''.join(wrapper.text),
+            grey_text=''.join(wrapper.grey) if wrapper.grey is not None else None
+        )
+        if self._wants_html is None or not self._wants_html(wrapper.color):
+            self._ready.append(_PendingItem(features, None, True))
+            return
+
+        # The item name's line break is dropped from the HTML, the same way the item name is read.
+        pending = _PendingItem(features, wrapper.font_br if wrapper.font is not None else wrapper.span_br, False)
+        if wrapper.grandparent.waiting is None:
+            wrapper.grandparent.waiting = []
+        wrapper.grandparent.waiting.append(pending)
+        self._ready.append(pending)
+
+    def _slice(self, start, end, cut):
+        if cut is not None and start <= cut[0] and cut[1] <= end:
+            return self._source[start - self._source_start:cut[0] - self._source_start] + self._source[cut[1] - self._source_start:end - self._source_start]
+
+        return self._source[start - self._source_start:end - self._source_start]
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def _trim(self):
+        # Any open element can still turn out to be the grandparent of an item wrapper, so the source is only dropped
+        # when no HTML is wanted at all.
+        if self._wants_html is not None:
+            return
+
+        keep_from = self._fed - len(self.rawdata)
+        if keep_from > self._source_start:
+            self._source = self._source[keep_from - self._source_start:]
+            self._source_start = keep_from
+
+def parse_armory_page(chunks, wants_html=None):
+    """Feeds the page chunks to an ArmoryPageParser. Returns (parser, items) - the parser holds the page flags."""
+
+    parser = ArmoryPageParser(wants_html)
+    items = []
+    for chunk in chunks:
+        parser.feed(chunk)
+        items.extend(parser.items())
+
+    parser.close()
+    items.extend(parser.items())
+    return parser, items
@@ -0,0 +1,268 @@
+import aiohttp
+import asyncio
+import re
+import time
+from html.parser import HTMLParser
+from .dclasses import Auction
+
+class AuctionFeed:
+    """
+    Cached snapshot of the trade center auctions.
+
+    The API is hit at most once per TTL window - concurrent callers that arrive while a refresh
+    is in flight wait for that refresh instead of starting their own.
+    """
+
+    def __init__(self, session, endpoint, parser):
+        self._session = session
+        self._endpoint = endpoint
+        self._parser = parser
+        self._auctions = None
+        self._fetched_at = 0
+        self._refreshes = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._fetched_at = 0
+
+    async def get(self, ttl):
+        """Returns the parsed auctions or None if the API couldn't be reached."""
+
+        if self._is_fresh(ttl):
+            return self._auctions
+
+        refreshes = self._refreshes
+        async with self._lock:
+            if refreshes != self._refreshes:
+                # Someone else refreshed while we were waiting - use their result, even if it failed.
+                return self._auctions
+
+            try:
+                return await self._refresh()
+            finally:
+                # Only counted once it's done, so the callers that queued up during the refresh see it and use its result.
+                self._refreshes += 1
+
+    async def _refresh(self):
+        try:
+            async with self._session.get(self._endpoint) as api_response:
+                if api_response.status != 200:
+                    self._auctions = None
+                    return None
+
+                api_json = await api_response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self._auctions = None
+            return None
+
+        self._auctions = self._parser(api_json['auctions'])
+        self._fetched_at = time.monotonic()
+        return self._auctions
+
+    def _is_fresh(self, ttl):
+        return self._auctions is not None and time.monotonic() - self._fetched_at < ttl
+
+class AuctionIndex:
+    """
+    Parsed auctions plus a trigram index over their titles and sellers.
+
+    Searches only verify the auctions that contain every trigram of the query instead of scanning all of them.
+    """
+
+    def __init__(self, auctions):
+        self.auctions = auctions
+        self._texts = [(auction.title.lower(), auction.seller.lower()) for auction in auctions]
+        self._trigrams = {}
+        for auction_id, texts in enumerate(self._texts):
+            for text in texts:
+                for trigram in _trigrams(text):
+                    self._trigrams.setdefault(trigram, set()).add(auction_id)
+
+    def __len__(self):
+        return len(self.auctions)
+
+    def __iter__(self):
+        return iter(self.auctions)
+
+    def search(self, query):
+        query = query.strip().lower()
+        trigrams = _trigrams(query)
+        if trigrams:
+            postings = sorted((self._trigrams.get(trigram, set()) for trigram in trigrams), key=len)
+            candidates = sorted(postings[0].intersection(*postings[1:]))
+        else:
+            candidates = range(len(self.auctions))
+
+        return [self.auctions[auction_id] for auction_id in candidates if query in self._texts[auction_id][0] or query in self._texts[auction_id][1]]
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class AuctionChanges:
+    def __init__(self, new, new_bids, ending_soon):
+        self.new = new
+        self.new_bids = new_bids
+        self.ending_soon = ending_soon
+
+    def __bool__(self):
+        return bool(self.new or self.new_bids or self.ending_soon)
+
+class AuctionDiffer:
+    """Diffs consecutive auction snapshots. An auction is reported as ending soon only once."""
+
+    def __init__(self, ending_soon_seconds=3600):
+        self.ending_soon_seconds = ending_soon_seconds
+        self._previous = None
+        self._ending_notified = set()
+
+    def reset(self):
+        self._previous = None
+        self._ending_notified = set()
+
+    def diff(self, auctions):
+        current = {_auction_key(auction): auction for auction in auctions}
+        previous = self._previous
+        self._previous = current
+        self._ending_notified &= current.keys()
+        if previous is None:
+            # First snapshot is just the baseline, otherwise every running auction would be reported as new.
+            self._ending_notified |= {key for key, auction in current.items() if self._is_ending_soon(auction)}
+            return AuctionChanges([], [], [])
+
+        new, new_bids, ending_soon = [], [], []
+        for key, auction in current.items():
+            previous_auction = previous.get(key)
+            if previous_auction is None:
+                new.append(auction)
+            elif _bid_count(auction) > _bid_count(previous_auction):
+                new_bids.append(auction)
+
+            if key not in self._ending_notified and self._is_ending_soon(auction):
+                self._ending_notified.add(key)
+                ending_soon.append(auction)
+
+        return AuctionChanges(new, new_bids, ending_soon)
+
+    def _is_ending_soon(self, auction):
+        seconds_left = parse_time_left(auction.time_left)
+        return seconds_left is not None and seconds_left <= self.ending_soon_seconds
+
+TIME_LEFT_UNITS = {'d': 86400, 'h': 3600, 'm': 60, 's': 1}
+TIME_LEFT_REGEX = re.compile(r'(\d+)\s*([dhms])')
+
+def parse_time_left(time_left):
+    """Parses strings like '1d 5h', '3 hours' or '12m 30s' into seconds. Returns None if nothing matches."""
+
+    parts = TIME_LEFT_REGEX.findall(time_left.lower())
+    if not parts:
+        return None
+
+    return sum(int(amount) * TIME_LEFT_UNITS[unit] for amount, unit in parts)
+
+def _auction_key(auction):
+    return auction.seller, auction.title
+
+def _bid_count(auction):
+    try:
+        return int(auction.bids)
+    except ValueError:
+        return 0
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+class AuctionExtractor(HTMLParser):
+    """
+    Single pass extractor for the tradecenter auction fragments.
+
+    Mirrors what the BeautifulSoup lookups used to pick out: the first `.coins`, `h4`, `span` and `.username` texts,
+    the text right after the `[title=Bids]` element and the `data-featherlight` of the `[title=Image]` element.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._depth = 0
+        self._open = {}
+        self._texts = {}
+        self._awaiting_bids = False
+        self._bids_depth = None
+        self.bids = ''
+        self.image = None
+
+    def text(self, field):
+        return ''.join(self._texts.get(field, ()))
+
+    def handle_starttag(self, tag, attrs):
+        self._awaiting_bids = False
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        fields = []
+        if tag == 'h4':
+            fields.append('title')
+        if tag == 'span':
+            fields.append('time_left')
+        if 'coins' in classes:
+            fields.append('current_bid')
+        if 'username' in classes:
+            fields.append('seller')
+
+        for field in fields:
+            if field not in self._texts:
+                self._texts[field] = []
+                self._open[field] = self._depth
+
+        if attrs.get('title') == 'Image' and self.image is None:
+            self.image = attrs.get('data-featherlight')
+
+        is_bids = attrs.get('title') == 'Bids' and self._bids_depth is None and not self.bids
+        if tag in VOID_ELEMENTS:
+            self._close_fields()
+            self._awaiting_bids = is_bids
+            return
+
+        if is_bids:
+            self._bids_depth = self._depth
+
+        self._depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS or self._depth == 0:
+            return
+
+        self._depth -= 1
+        self._close_fields()
+        if self._bids_depth == self._depth:
+            self._bids_depth = None
+            self._awaiting_bids = True
+        else:
+            self._awaiting_bids = False
+
+    def handle_data(self, data):
+        if self._awaiting_bids:
+            self.bids = data.strip()
+            self._awaiting_bids = False
+
+        for field in self._open:
+            self._texts[field].append(data)
+
+    def _close_fields(self):
+        for field, depth in list(self._open.items()):
+            if depth >= self._depth:
+                del self._open[field]
+
+def parse_auction(fragment):
+    extractor = AuctionExtractor()
+    extractor.feed(fragment)
+    extractor.close()
+    return Auction(
+        title=extractor.text('title'),
+        seller=extractor.text('seller'),
+        current_bid=extractor.text('current_bid'),
+        bids=extractor.bids,
+        time_left=extractor.text('time_left').strip(),
+        image=extractor.image
+    )
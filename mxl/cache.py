@@ -0,0 +1,190 @@
+import collections
+import os
+import pathlib
+import threading
+import time
+import uuid
+
+class TTLCache:
+    """Bounded LRU cache where every entry expires after its own TTL."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+class RenderCache:
+    """
+    Content addressed store of rendered images on disk - one `<key>.png` file per image in `directory`.
+
+    The least recently used files are evicted once they take up more than `max_bytes`, except for pinned ones - `pin`
+    keeps the images' files, whether they're stored yet or not, until `unpin` releases them, e.g. while they wait to be
+    uploaded. Safe to use from several threads.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None
+        self._bytes = 0
+        self._pinned = collections.Counter()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    @property
+    def size(self):
+        with self._lock:
+            self._load()
+            return self._bytes
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def get(self, key):
+        """Returns the path of the stored image or None."""
+
+        with self._lock:
+            entries = self._load()
+            if key not in entries:
+                self.misses += 1
+                return None
+
+            entries.move_to_end(key)
+            self.hits += 1
+
+        path = self._path(key)
+        try:
+            # The file times are the LRU order when the cache is loaded again.
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            return None
+
+        return path
+
+    def put(self, key, image):
+        """Stores the image bytes under `key` and returns the image's path."""
+
+        with self._lock:
+            self._load()
+
+        path = self._path(key)
+        temporary = self.directory / f'.{key}-{uuid.uuid4().hex}.png'
+        try:
+            temporary.write_bytes(image)
+            os.replace(temporary, path)
+        finally:
+            if temporary.exists():
+                temporary.unlink()
+
+        with self._lock:
+            entries = self._load()
+            self._forget(key)
+            entries[key] = len(image)
+            self._bytes += len(image)
+            self._evict(key)
+
+        return path
+
+    def pin(self, keys):
+        with self._lock:
+            self._pinned.update(keys)
+
+    def unpin(self, keys):
+        """Releases pinned images - their files are evicted by a later `put` if the cache is too big."""
+
+        with self._lock:
+            for key in keys:
+                self._pinned[key] -= 1
+                if self._pinned[key] <= 0:
+                    del self._pinned[key]
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._load()):
+                if key not in self._pinned:
+                    self._remove(key)
+
+            self.hits = 0
+            self.misses = 0
+
+    def _path(self, key):
+        return self.directory / f'{key}.png'
+
+    def _load(self):
+        if self._entries is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.png') and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-len('.png')], stat.st_size))
+
+            self._entries = collections.OrderedDict((key, size) for _, key, size in sorted(files))
+            self._bytes = sum(self._entries.values())
+
+        return self._entries
+
+    def _evict(self, newest):
+        # The newest image always stays, even if it's bigger than the whole cache - it's about to be used.
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+
+            if key != newest and key not in self._pinned:
+                self._remove(key)
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _remove(self, key):
+        self._forget(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
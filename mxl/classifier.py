@@ -0,0 +1,206 @@
+import enum
+import re
+from .constants import SU_ITEMS, SSU_ITEMS, SSSU_ITEMS, AMULETS, RINGS, JEWELS, MOS, RUNEWORDS, QUIVERS, SETS, \
+                       IGNORED_ITEMS, SHRINE_VESSELS, WHITE_IGNORED_ITEMS, CHARMS, TROPHIES, ORANGE_IGNORED_ITEMS, VESSEL_TO_SHRINE
+
+class ItemCategory(enum.Enum):
+    SU = 1
+    SSU = 2
+    SSSU = 3
+    RUNEWORD = 4
+    AMULET = 5
+    RING = 6
+    JEWEL = 7
+    QUIVER = 8
+    MO = 9
+
+# Same precedence as the old `if item_name in ...` cascade - the first list that contains a name wins.
+NAME_CATEGORIES = {}
+for _category, _names in ((ItemCategory.SU, SU_ITEMS), (ItemCategory.SSU, SSU_ITEMS), (ItemCategory.SSSU, SSSU_ITEMS),
+                          (ItemCategory.RUNEWORD, RUNEWORDS), (ItemCategory.AMULET, AMULETS), (ItemCategory.RING, RINGS),
+                          (ItemCategory.JEWEL, JEWELS), (ItemCategory.QUIVER, QUIVERS), (ItemCategory.MO, MOS)):
+    for _name in _names:
+        NAME_CATEGORIES.setdefault(_name, _category)
+
+IGNORED_NAMES = frozenset(IGNORED_ITEMS)
+WHITE_IGNORED_NAMES = frozenset(WHITE_IGNORED_ITEMS)
+ORANGE_IGNORED_NAMES = frozenset(ORANGE_IGNORED_ITEMS)
+CHARM_NAMES = frozenset(CHARMS)
+TROPHY_NAMES = frozenset(TROPHIES)
+SHRINE_VESSEL_NAMES = frozenset(SHRINE_VESSELS)
+
+SET_TAG_REGEX = re.compile(r'\[([^\]]+)')
+SHRINE_REGEX = re.compile(r'Shrine \(([^\)]+)')
+SHARDS_REGEX = re.compile(r'Shards \(([^\)]+)')
+QUANTITY_REGEX = re.compile(r'Quantity: ([0-9]+)')
+
+class ItemFeatures:
+    """The per-item inputs of the classification rules, as extracted from the armory page."""
+
+    __slots__ = ('name', 'color', 'text', 'grey_text', 'html', '_quantity')
+
+    def __init__(self, name, color, text='', grey_text=None, html=None):
+        self.name = name
+        self.color = color
+        self.text = text
+        self.grey_text = grey_text
+        self.html = html
+        self._quantity = None
+
+    @property
+    def ethereal(self):
+        return 'Ethereal' in self.text
+
+    @property
+    def quantity(self):
+        if self._quantity is None:
+            self._quantity = int(QUANTITY_REGEX.search(self.grey_text).group(1))
+
+        return self._quantity
+
+class Rule:
+    """
+    One row of the classification table.
+
+    An item matches when its color is in `colors`, its name is in `names`, contains `name_contains`, isn't in `excluded`,
+    `pattern` matches its name and the user has `option` enabled (every unset condition matches). The first matching rule
+    files the item under `bucket` - `resolve(features, match)` can return a different (name, amount, group) than the default
+    (item name, 1, None). A rule without a bucket drops the item.
+    """
+
+    __slots__ = ('bucket', 'colors', 'names', 'name_contains', 'excluded', 'pattern', 'option', 'resolve')
+
+    def __init__(self, bucket, colors=None, names=None, name_contains=None, excluded=frozenset(), pattern=None, option=None, resolve=None):
+        self.bucket = bucket
+        self.colors = frozenset(colors) if colors is not None else None
+        self.names = frozenset(names) if names is not None else None
+        self.name_contains = name_contains
+        self.excluded = frozenset(excluded)
+        self.pattern = pattern
+        self.option = option
+        self.resolve = resolve
+
+    @property
+    def names_only(self):
+        return self.names is not None and self.colors is None and self.name_contains is None and not self.excluded \
+               and self.pattern is None and self.option is None
+
+    def matches(self, features, user_config):
+        if self.names is not None and features.name not in self.names:
+            return False, None
+        if self.name_contains is not None and self.name_contains not in features.name:
+            return False, None
+        if features.name in self.excluded:
+            return False, None
+        if self.option is not None and not user_config[self.option]:
+            return False, None
+
+        match = None
+        if self.pattern is not None:
+            match = self.pattern.search(features.name)
+            if match is None:
+                return False, None
+
+        return True, match
+
+    def apply(self, features, match):
+        if self.bucket is None:
+            return None
+
+        if self.resolve is None:
+            return self.bucket, features.name, 1, None
+
+        return (self.bucket, *self.resolve(features, match))
+
+class RuleTable:
+    """
+    Rules compiled into one decision list per item color.
+
+    Each color only sees the rules that can apply to it, and runs of plain name membership rules are merged
+    into a single dict lookup (the earliest rule keeps a name, like in the ordered list).
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        colors = set().union(*(rule.colors for rule in rules if rule.colors is not None))
+        self._color_steps = {color: self._compile([rule for rule in rules if rule.colors is None or color in rule.colors]) for color in colors}
+        self._default_steps = self._compile([rule for rule in rules if rule.colors is None])
+
+    def classify(self, features, user_config):
+        """Returns (bucket, name, amount, group) for the item or None if it should be ignored."""
+
+        for step in self._color_steps.get(features.color, self._default_steps):
+            if isinstance(step, dict):
+                rule = step.get(features.name)
+                if rule is not None:
+                    return rule.apply(features, None)
+
+                continue
+
+            matched, match = step.matches(features, user_config)
+            if matched:
+                return step.apply(features, match)
+
+        return None
+
+    def colors_for(self, bucket):
+        """The color classes an item must have to end up in `bucket` or None if any color can."""
+
+        colors = set()
+        for rule in self.rules:
+            if rule.bucket != bucket:
+                continue
+            if rule.colors is None:
+                return None
+
+            colors |= rule.colors
+
+        return frozenset(colors)
+
+    @staticmethod
+    def _compile(rules):
+        steps = []
+        for rule in rules:
+            if not rule.names_only:
+                steps.append(rule)
+                continue
+
+            if not steps or not isinstance(steps[-1], dict):
+                steps.append({})
+
+            for name in rule.names:
+                steps[-1].setdefault(name, rule)
+
+        return steps
+
+def _category_names(category):
+    return [name for name, name_category in NAME_CATEGORIES.items() if name_category == category]
+
+ITEM_RULES = RuleTable([
+    Rule(None, names=IGNORED_NAMES),
+    Rule('sets', pattern=SET_TAG_REGEX, resolve=lambda features, match: (features.name.split('[')[0].strip(), 1, match.group(1))),
+    Rule('sets', colors=['color-green'], names=SETS, resolve=lambda features, match: (features.name, 1, SETS[features.name])),
+    Rule('su', names=_category_names(ItemCategory.SU)),
+    Rule('su', name_contains='Hanfod', resolve=lambda features, match: ('Hanfod Tân', 1, None)),
+    Rule('other', names=['Jewel']),
+    Rule('ssu', names=_category_names(ItemCategory.SSU)),
+    Rule('sssu', names=_category_names(ItemCategory.SSSU)),
+    Rule('runewords', names=_category_names(ItemCategory.RUNEWORD)),
+    Rule('amulets', names=_category_names(ItemCategory.AMULET)),
+    Rule('rings', names=_category_names(ItemCategory.RING)),
+    Rule('jewels', names=_category_names(ItemCategory.JEWEL)),
+    Rule('quivers', names=_category_names(ItemCategory.QUIVER)),
+    Rule('mos', names=_category_names(ItemCategory.MO)),
+    Rule('rw_bases', colors=['color-white', 'color-blue'], excluded=WHITE_IGNORED_NAMES,
+         resolve=lambda features, match: (features.name + ' [eth]' if features.ethereal else ''.join(features.name.split('Superior ')), 1, None)),
+    Rule('shrine_bases', colors=['color-yellow']),
+    Rule('charms', names=CHARM_NAMES),
+    Rule('shrines', pattern=SHRINE_REGEX, resolve=lambda features, match: (features.name.split('(')[0].strip(), int(match.group(1)) / 10, None)),
+    Rule('shrines', names=SHRINE_VESSEL_NAMES, resolve=lambda features, match: (VESSEL_TO_SHRINE[features.name], features.quantity, None)),
+    Rule('other', names=['Arcane Cluster'], resolve=lambda features, match: ('Arcane Crystal', features.quantity, None)),
+    Rule('other', pattern=SHARDS_REGEX, resolve=lambda features, match: ('Arcane Crystal', int(match.group(1)) / 5, None)),
+    Rule('shrine_bases', colors=['color-orange'], excluded=ORANGE_IGNORED_NAMES | TROPHY_NAMES, option='crafted_as_base'),
+    Rule('crafted', colors=['color-orange'], excluded=ORANGE_IGNORED_NAMES | TROPHY_NAMES),
+    Rule('trophies', names=TROPHY_NAMES),
+    Rule('other')
+])
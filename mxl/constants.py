@@ -1374,6 +1374,27 @@ WHITE_IGNORED_ITEMS = [
     'Mephisto\'s Soulstone'
 ]
 
+PRICECHECK_PAGE_SIZE = 25
+PRICECHECK_MAX_PAGES = 10
+PRICECHECK_CONCURRENT_PAGES = 3
+HISTORY_CRAWL_PAGES = 4
+ARMORY_CONCURRENT_FETCHES = 4
+ARMORY_CHUNK_SIZE = 65536
+# Seconds to send trade posts straight to DMs after pastebin reported its post limit.
+PASTEBIN_LIMIT_COOLDOWN = 3600
+CRAFTED_IMAGE_RENDER_WORKERS = 4
+CRAFTED_IMAGE_RENDER_BATCH = 10
+CRAFTED_IMAGE_SHEET_SIZE = 24
+CRAFTED_IMAGE_SHEET_WIDTH = 1280
+CRAFTED_IMAGE_UPLOAD_CONCURRENCY = 4
+# Seconds a single upload, and the trade post waiting for any image, may take before it counts as failed.
+CRAFTED_IMAGE_UPLOAD_TIMEOUT = 60
+CRAFTED_IMAGE_WAIT_TIMEOUT = 600
+TRADE_POST_WORKERS = 4
+IMAGE_UPLOAD_ATTEMPTS = 3
+IMAGE_UPLOAD_BACKOFF = 2
+FLICKR_CACHE_PAGE_SIZE = 15
+
 TRADE_POST_SETS_SECTION = '''[color=#00FF00][size=24]Sets[/size][/color]
 [hr][/hr]
 {items}'''
@@ -1432,3 +1453,33 @@ TRADE_POST_TEMPLATE = '''[color=#FFFF00][size=26]Selling[/size][/color]
 [hr][/hr]
 {items}
 '''
+
+TRADE_POST_GROUP_HEADER = '[u][color=#00FF00]{group}[/color][/u]\n'
+
+# The trade post sections in order. Every section lists its categories as
+# (category, opening tag, closing tag, amount shown when != 1 instead of > 1, blank line after a non-empty category).
+TRADE_POST_SECTIONS = [
+    (TRADE_POST_SETS_SECTION, [('sets', '[item]', '[/item]', False, False)]),
+    (TRADE_POST_SU_SECTION, [('su', '[item]', '[/item]', False, False)]),
+    (TRADE_POST_SSU_SECTION, [('ssu', '[item]', '[/item]', False, False)]),
+    (TRADE_POST_SSSU_SECTION, [('sssu', '[item]', '[/item]', False, False)]),
+    (TRADE_POST_RUNEWORDS_SECTION, [('runewords', '[item]', '[/item]', False, False)]),
+    (TRADE_POST_CRAFTED_SECTION, [('crafted', '[color=#FAAA23]', '[/color]', False, False)]),
+    (TRADE_POST_RAQMOJ_SECTION, [
+        ('rings', '[item]', '[/item]', False, True),
+        ('amulets', '[item]', '[/item]', False, True),
+        ('quivers', '[item]', '[/item]', False, True),
+        ('mos', '[item]', '[/item]', False, True),
+        ('jewels', '[item]', '[/item]', False, False)
+    ]),
+    (TRADE_POST_BASES_SECTION, [
+        ('rw_bases', '[color=#808080]', '[/color]', False, False),
+        ('shrine_bases', '[color=#FFFF00]', '[/color]', False, False)
+    ]),
+    (TRADE_POST_CHARMS_SECTION, [('charms', '[item]', '[/item]', False, False)]),
+    (TRADE_POST_TROPHIES_SECTION, [('trophies', '[color=#FF7F50]', '[/color]', False, False)]),
+    (TRADE_POST_MISC_SECTION, [
+        ('shrines', '[color=#FAAA23]', '[/color]', True, True),
+        ('other', '', '', True, False)
+    ])
+]
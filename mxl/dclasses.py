@@ -1,15 +1,9 @@
 import dataclasses
-from .constants import TRADE_POST_SETS_SECTION, TRADE_POST_SU_SECTION, TRADE_POST_SSU_SECTION,\
-                       TRADE_POST_SSSU_SECTION, TRADE_POST_RUNEWORDS_SECTION, TRADE_POST_RAQMOJ_SECTION,\
-                       TRADE_POST_BASES_SECTION, TRADE_POST_CHARMS_SECTION, TRADE_POST_TROPHIES_SECTION,\
-                       TRADE_POST_MISC_SECTION, TRADE_POST_CRAFTED_SECTION, TRADE_POST_TEMPLATE, SHRINES
-from typing import Set, Dict, List
-import imgkit
-import os
-import tempfile
-import random
-import flickrapi
-import hashlib
+from .constants import TRADE_POST_SECTIONS, TRADE_POST_GROUP_HEADER, TRADE_POST_TEMPLATE
+from typing import Optional
+import array
+import sys
+import discord
 import enum
 
 class PostGenerationErrors(enum.Enum):
@@ -17,258 +11,295 @@ class PostGenerationErrors(enum.Enum):
     UNKNOWN = 2
 
 @dataclasses.dataclass
-class Item:
-    name: str
-    characters: List = dataclasses.field(default_factory=list)
-    amount: float = 0
-    html: List = dataclasses.field(default_factory=list)
+class Auction:
+    title: str
+    seller: str
+    current_bid: str
+    bids: str
+    time_left: str
+    image: Optional[str] = None
+
+    def to_embed(self):
+        description = f'Started by: {self.seller}\nCurrent bids: {self.bids}\nCurrent bid: {self.current_bid} TG\nTime left: {self.time_left}'
+        embed = discord.Embed(title=self.title, description=description)
+        if self.image is not None:
+            embed.set_image(url=self.image)
+
+        return embed
+
+@dataclasses.dataclass(frozen=True)
+class Transaction:
+    sender: str
+    receiver: str
+    tg: str
+    note: str
+    date: str
+
+class CategoryRegistry:
+    """
+    The item categories of a dump, in a fixed order.
+
+    Grouped categories (sets) keep their items per group, rendered categories (crafted) keep the items' HTML.
+    """
+
+    def __init__(self, names, grouped=(), rendered=()):
+        self.names = tuple(names)
+        self.index = {name: index for index, name in enumerate(self.names)}
+        self.grouped = frozenset(grouped)
+        self.rendered = frozenset(rendered)
+
+    def __len__(self):
+        return len(self.names)
+
+CATEGORIES = CategoryRegistry(
+    ('sets', 'su', 'ssu', 'sssu', 'amulets', 'rings', 'jewels', 'mos', 'quivers', 'runewords', 'rw_bases',
+     'shrine_bases', 'charms', 'trophies', 'shrines', 'crafted', 'other'),
+    grouped=('sets',),
+    rendered=('crafted',)
+)
+RENDERED_BUCKETS = CATEGORIES.rendered
 
-    def __hash__(self):
-        return hash(self.name)
+class Item:
+    __slots__ = ('name', 'amount', 'characters', 'html')
 
-    def increment(self, character, html, amount = 1):
-        self.amount += amount
-        self.characters.append(character)
-        self.html.append(html)
+    def __init__(self, name, amount, characters, html):
+        self.name = name
+        self.amount = amount
+        self.characters = characters
+        self.html = html
 
-@dataclasses.dataclass
-class Set:
-    name: str
-    items: Dict[str, Item] = dataclasses.field(default_factory=dict)
+    def __repr__(self):
+        return f'Item(name={self.name!r}, amount={self.amount!r})'
 
-@dataclasses.dataclass
 class ItemDump:
-    sets: Dict[str, Set] = dataclasses.field(default_factory=dict)
-    su: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    ssu: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    sssu: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    amulets: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    rings: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    jewels: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    mos: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    quivers: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    runewords: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    rw_bases: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    shrine_bases: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    charms: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    trophies: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    shrines: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    crafted: Dict[str, Item] = dataclasses.field(default_factory=dict)
-    other: Dict[str, Item] = dataclasses.field(default_factory=dict)
+    """
+    The classified items of one or more characters.
+
+    Every (category, group, name) gets an item id on first sight. Amounts live in one flat array indexed by item id,
+    next to the characters that hold the item and, for rendered categories, the items' HTML. `Item` records are only
+    built when a category is read.
+    """
+
+    __slots__ = ('_ids', '_keys', '_amounts', '_fractional', '_characters', '_html', '_category_ids')
+
+    def __init__(self):
+        self._ids = {}
+        self._keys = []
+        self._amounts = array.array('d')
+        # Amounts are printed as ints unless a fractional amount (shrine pieces, shards) was added.
+        self._fractional = bytearray()
+        self._characters = []
+        self._html = []
+        self._category_ids = [[] for _ in range(len(CATEGORIES))]
 
     def __bool__(self):
-        return bool(self.sets or self.su or self.ssu or self.sssu or self.amulets or \
-               self.rings or self.jewels or self.mos or self.quivers or \
-               self.runewords or self.rw_bases or self.shrine_bases or \
-               self.charms or self.trophies or self.shrines or self.other)
-
-    def increment_set_item(self, set_name, item_name, character, html):
-        self.sets.setdefault(set_name, Set(name=set_name)).items.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_su(self, item_name, character, html):
-        self.su.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_ssu(self, item_name, character, html):
-        self.ssu.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_sssu(self, item_name, character, html):
-        self.sssu.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_amulet(self, item_name, character, html):
-        self.amulets.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_ring(self, item_name, character, html):
-        self.rings.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_jewel(self, item_name, character, html):
-        self.jewels.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_mo(self, item_name, character, html):
-        self.mos.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_quiver(self, item_name, character, html):
-        self.quivers.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_rw(self, item_name, character, html):
-        self.runewords.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_rw_base(self, item_name, character, html):
-        self.rw_bases.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_shrine_base(self, item_name, character, html):
-        self.shrine_bases.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_charm(self, item_name, character, html):
-        self.charms.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_trophy(self, item_name, character, html):
-        self.trophies.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_shrine(self, item_name, character, html, amount = 1):
-        self.shrines.setdefault(item_name, Item(name=item_name)).increment(character, html, amount)
-
-    def increment_crafted(self, item_name, character, html):
-        self.crafted.setdefault(item_name, Item(name=item_name)).increment(character, html)
-
-    def increment_other(self, item_name, character, html, amount = 1):
-        self.other.setdefault(item_name, Item(name=item_name)).increment(character, html, amount)
-
-    def to_trade_post(self, flickr_client, css_file, user_config, flickr_cache):
-        items_section = ''
-        sets_str = ''
-        cache_update = {}
-        for set_ in sorted(self.sets.values(), key=lambda k: k.name):
-            sets_str += f'[u][color=#00FF00]{set_.name}[/color][/u]\n'
-            for item in sorted(set_.items.values(), key=lambda k: k.name):
-                sets_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-            sets_str += '\n'
-
-        if sets_str:
-            items_section += TRADE_POST_SETS_SECTION.format(items = sets_str)
-
-        su_str = ''
-        for item in sorted(self.su.values(), key=lambda k: k.name):
-            su_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if su_str:
-            items_section += TRADE_POST_SU_SECTION.format(items = su_str)
-
-        ssu_str = ''
-        for item in sorted(self.ssu.values(), key=lambda k: k.name):
-            ssu_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if ssu_str:
-            items_section += TRADE_POST_SSU_SECTION.format(items = ssu_str)
-
-        sssu_str = ''
-        for item in sorted(self.sssu.values(), key=lambda k: k.name):
-            sssu_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if sssu_str:
-            items_section += TRADE_POST_SSSU_SECTION.format(items = sssu_str)
-
-        runewords_str = ''
-        for item in sorted(self.runewords.values(), key=lambda k: k.name):
-            runewords_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if runewords_str:
-            items_section += TRADE_POST_RUNEWORDS_SECTION.format(items = runewords_str)
-
-        crafted_str = ''
-        for item in sorted(self.crafted.values(), key=lambda k: k.name):
-            crafted_str += f'[color=#FAAA23]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#FAAA23]{item.name}[/color]\n'
-
-            if user_config['generate_crafted_images']:
-                crafted_str += '[spoil]\n'
-
-                for tag in item.html:
-                    if tag.find(class_='gear_img'):
-                        tag.img.extract()
-                    else:
-                        tag.img['src'] = f'https://tsw.vn.cz/acc/{tag.img["src"]}'
-                        tag.span.extract()
-
-                    tag.div['style'] = 'display: block; white-space: nowrap;'
-
-                    hash_md5 = hashlib.md5()
-                    hash_md5.update(str(tag).encode())
-                    item_md5 = hash_md5.hexdigest()
-                    if item_md5 in flickr_cache:
-                        crafted_str += f'[img]{flickr_cache[item_md5]}[/img]'
-                        continue
-
-                    if item_md5 in cache_update:
-                        crafted_str += f'[img]{cache_update[item_md5]}[/img]'
-                        continue
-
-                    image_file = os.path.join(tempfile.gettempdir(), ''.join(random.choice('0123456789ABCDEF') for i in range(12)) + '.png')
-                    imgkit.from_string(str(tag), image_file, css=css_file, options={'width': '0'})
-
-                    image_id = ''
-                    image_link = ''
-                    try:
-                        image_id = flickr_client.upload(image_file).photoid[0].text
-                        image_link = flickr_client.photos.getSizes(photo_id=image_id).sizes[0].size[-1]['source']
-                    except:
-                        return None, cache_update, PostGenerationErrors.IMAGE_UPLOAD_FAILED
-                    finally:
-                        os.remove(image_file)
-
-                    crafted_str += f'[img]{image_link}[/img]\n'
-                    cache_update[item_md5] = image_link
-
-                crafted_str += '[/spoil]\n'
-
-        if self.crafted:
-            items_section += TRADE_POST_CRAFTED_SECTION.format(items = crafted_str)
-
-        raqmoj_str = ''
-        for item in sorted(self.rings.values(), key=lambda k: k.name):
-            raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if self.rings:
-            raqmoj_str += '\n'
-
-        for item in sorted(self.amulets.values(), key=lambda k: k.name):
-            raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if self.amulets:
-            raqmoj_str += '\n'
-
-        for item in sorted(self.quivers.values(), key=lambda k: k.name):
-            raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if self.quivers:
-            raqmoj_str += '\n'
-
-        for item in sorted(self.mos.values(), key=lambda k: k.name):
-            raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if self.mos:
-            raqmoj_str += '\n'
-
-        for item in sorted(self.jewels.values(), key=lambda k: k.name):
-            raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if raqmoj_str:
-            items_section += TRADE_POST_RAQMOJ_SECTION.format(items = raqmoj_str)
-
-        bases_str = ''
-        for item in sorted(self.rw_bases.values(), key=lambda k: k.name):
-            bases_str += f'[color=#808080]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#808080]{item.name}[/color]\n'
-
-        for item in sorted(self.shrine_bases.values(), key=lambda k: k.name):
-            bases_str += f'[color=#FFFF00]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#FFFF00]{item.name}[/color]\n'
-
-        if bases_str:
-            items_section += TRADE_POST_BASES_SECTION.format(items = bases_str)
-
-        charms_str = ''
-        for item in sorted(self.charms.values(), key=lambda k: k.name):
-            charms_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
-
-        if charms_str:
-            items_section += TRADE_POST_CHARMS_SECTION.format(items = charms_str)
-
-        trophies_str = ''
-        for item in sorted(self.trophies.values(), key=lambda k: k.name):
-            trophies_str += f'[color=#FF7F50]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#FF7F50]{item.name}[/color]\n'
-
-        if trophies_str:
-            items_section += TRADE_POST_TROPHIES_SECTION.format(items = trophies_str)
-
-        other_str = ''
-        for item in sorted(self.shrines.values(), key=lambda k: k.name):
-            other_str += f'[color=#FAAA23]{item.name}[/color] x{item.amount}\n' if item.amount != 1 else f'[color=#FAAA23]{item.name}[/color]\n'
+        return bool(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
 
-        if self.shrines:
-            other_str += '\n'
+    def add(self, bucket, item_name, character, html, amount = 1, group = None):
+        category = CATEGORIES.index[bucket]
+        key = (category, group if bucket in CATEGORIES.grouped else None, sys.intern(item_name))
+        item_id = self._ids.get(key)
+        if item_id is None:
+            item_id = self._new_item(key)
 
-        for item in sorted(self.other.values(), key=lambda k: k.name):
-            other_str += f'{item.name} x{item.amount}\n' if item.amount != 1 else f'{item.name}\n'
+        self._amounts[item_id] += amount
+        if isinstance(amount, float):
+            self._fractional[item_id] = 1
 
-        if other_str:
-            items_section += TRADE_POST_MISC_SECTION.format(items = other_str)
+        self._characters[item_id].append(sys.intern(character))
+        if html is not None and self._html[item_id] is not None:
+            self._html[item_id].append(html)
+
+    def merge(self, other):
+        """Adds all of `other`'s items to this dump."""
 
-        return TRADE_POST_TEMPLATE.format(items = items_section), cache_update, None
\ No newline at end of file
+        for other_id, key in enumerate(other._keys):
+            item_id = self._ids.get(key)
+            if item_id is None:
+                item_id = self._new_item(key)
+
+            self._amounts[item_id] += other._amounts[other_id]
+            self._fractional[item_id] |= other._fractional[other_id]
+            self._characters[item_id].extend(other._characters[other_id])
+            if other._html[other_id]:
+                self._html[item_id].extend(other._html[other_id])
+
+        return self
+
+    def has(self, bucket):
+        return bool(self._category_ids[CATEGORIES.index[bucket]])
+
+    def items(self, bucket):
+        """The category's items, sorted by name."""
+
+        return sorted((self._item(item_id) for item_id in self._category_ids[CATEGORIES.index[bucket]]), key=lambda k: k.name)
+
+    def groups(self, bucket):
+        """The grouped category's (group, items) pairs, sorted by group and item name."""
+
+        groups = {}
+        for item_id in self._category_ids[CATEGORIES.index[bucket]]:
+            groups.setdefault(self._keys[item_id][1], []).append(self._item(item_id))
+
+        return [(group, sorted(items, key=lambda k: k.name)) for group, items in sorted(groups.items(), key=lambda k: k[0])]
+
+    def amounts(self, bucket):
+        """The category's (name, amount) pairs, sorted by name - read straight from the arrays, without Item records."""
+
+        return sorted(self._amount(item_id) for item_id in self._category_ids[CATEGORIES.index[bucket]])
+
+    def group_amounts(self, bucket):
+        """The grouped category's (group, (name, amount) pairs) pairs, sorted by group and item name."""
+
+        groups = {}
+        for item_id in self._category_ids[CATEGORIES.index[bucket]]:
+            groups.setdefault(self._keys[item_id][1], []).append(self._amount(item_id))
+
+        return [(group, sorted(amounts)) for group, amounts in sorted(groups.items(), key=lambda k: k[0])]
+
+    def _amount(self, item_id):
+        amount = self._amounts[item_id]
+        return self._keys[item_id][2], amount if self._fractional[item_id] else int(amount)
+
+    def _new_item(self, key):
+        item_id = len(self._keys)
+        self._ids[key] = item_id
+        self._keys.append(key)
+        self._amounts.append(0)
+        self._fractional.append(0)
+        self._characters.append([])
+        self._html.append([] if CATEGORIES.names[key[0]] in CATEGORIES.rendered else None)
+        self._category_ids[key[0]].append(item_id)
+        return item_id
+
+    def _item(self, item_id):
+        amount = self._amounts[item_id]
+        return Item(
+            name=self._keys[item_id][2],
+            amount=amount if self._fractional[item_id] else int(amount),
+            characters=self._characters[item_id],
+            html=self._html[item_id] or []
+        )
+
+    def to_trade_post(self, user_config, images=None):
+        """Returns a (post, PostGenerationErrors) pair."""
+
+        sections = self.iter_trade_post(user_config, images)
+        parts = []
+        while True:
+            try:
+                parts.append(next(sections))
+            except StopIteration as stop:
+                if stop.value is not None:
+                    return None, stop.value
+
+                return ''.join(parts), None
+
+    def rendered_html(self):
+        """The HTML of every item in the rendered categories."""
+
+        for bucket in CATEGORIES.rendered:
+            for item_id in self._category_ids[CATEGORIES.index[bucket]]:
+                yield from self._html[item_id]
+
+    def iter_trade_post(self, user_config, images=None):
+        """
+        Renders the forum trade post one section at a time.
+
+        Sections and their categories come from TRADE_POST_SECTIONS. The yielded parts joined together are the whole post.
+        Crafted item images come from `images` (an ItemImages), waiting for the ones that are still being uploaded, so this
+        must run on a worker thread when images are generated. With `crafted_images_sprite_sheet` the crafted items are
+        listed without images and followed by the sprite sheets instead. Returns a PostGenerationErrors value (as the
+        generator's return value) if the post couldn't be finished.
+        """
+
+        generate_images = user_config['generate_crafted_images'] and images is not None
+        sprite_sheets = generate_images and user_config['crafted_images_sprite_sheet']
+        emitted_images = set()
+        post_prefix, post_suffix = _split_template(TRADE_POST_TEMPLATE)
+        yield post_prefix
+        for section_template, categories in TRADE_POST_SECTIONS:
+            section_prefix, section_suffix = _split_template(section_template)
+            parts = [section_prefix]
+            for bucket, opening, closing, show_if_not_one, blank_line in categories:
+                if bucket in CATEGORIES.grouped:
+                    for group, amounts in self.group_amounts(bucket):
+                        parts.append(TRADE_POST_GROUP_HEADER.format(group=group))
+                        _render_items(parts, amounts, opening, closing, show_if_not_one)
+                        parts.append('\n')
+
+                    continue
+
+                if generate_images and not sprite_sheets and bucket in CATEGORIES.rendered:
+                    items = self.items(bucket)
+                    for item in items:
+                        _render_items(parts, ((item.name, item.amount),), opening, closing, show_if_not_one)
+                        if not _render_images(parts, item, images, emitted_images):
+                            return PostGenerationErrors.IMAGE_UPLOAD_FAILED
+                else:
+                    items = self.amounts(bucket)
+                    _render_items(parts, items, opening, closing, show_if_not_one)
+
+                if items and blank_line:
+                    parts.append('\n')
+
+                if sprite_sheets and items and bucket in CATEGORIES.rendered and not emitted_images:
+                    if not _render_sheets(parts, images, emitted_images):
+                        return PostGenerationErrors.IMAGE_UPLOAD_FAILED
+
+            # Sections without any items are left out.
+            if len(parts) > 1:
+                parts.append(section_suffix)
+                yield ''.join(parts)
+
+        yield post_suffix
+        return None
+
+def _split_template(template):
+    prefix, suffix = template.split('{items}')
+    return prefix, suffix
+
+def _render_images(parts, item, images, emitted_images):
+    """Appends the item's images in a spoiler. Returns False if one of them couldn't be uploaded."""
+
+    parts.append('[spoil]\n')
+    for html in item.html:
+        image = images.result(html)
+        if image is None:
+            return False
+
+        key, link, uploaded = image
+        # Freshly uploaded images get their own line the first time they're posted, like they always have.
+        if uploaded and key not in emitted_images:
+            emitted_images.add(key)
+            parts.append(f'[img]{link}[/img]\n')
+        else:
+            parts.append(f'[img]{link}[/img]')
+
+    parts.append('[/spoil]\n')
+    return True
+
+def _render_sheets(parts, images, emitted_images):
+    """Appends every sprite sheet in a spoiler. Returns False if one of them couldn't be uploaded."""
+
+    sheets = images.results()
+    if None in sheets:
+        return False
+
+    parts.append('[spoil]\n')
+    for key, link, _ in sheets:
+        emitted_images.add(key)
+        parts.append(f'[img]{link}[/img]\n')
+
+    parts.append('[/spoil]\n')
+    return True
+
+def _render_items(parts, amounts, opening, closing, show_if_not_one):
+    for name, amount in amounts:
+        if amount != 1 if show_if_not_one else amount > 1:
+            parts.append(f'{opening}{name}{closing} x{amount}\n')
+        else:
+            parts.append(f'{opening}{name}{closing}\n')
@@ -0,0 +1,166 @@
+import datetime
+import time
+from .dclasses import Transaction
+from .storage import SQLiteStore
+
+TRANSACTION_DATE_FORMATS = [
+    '%a %b %d, %Y %I:%M %p',
+    '%a %b %d, %Y %H:%M',
+    '%d %b %Y, %H:%M',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%d.%m.%Y %H:%M',
+    '%Y-%m-%d'
+]
+
+def parse_transaction_date(date):
+    """Returns the transaction date as a UNIX timestamp or None if it's in an unknown format."""
+
+    date = ' '.join(date.split())
+    for date_format in TRANSACTION_DATE_FORMATS:
+        try:
+            return int(datetime.datetime.strptime(date, date_format).replace(tzinfo=datetime.timezone.utc).timestamp())
+        except ValueError:
+            continue
+
+    return None
+
+def normalize_search(search):
+    return ' '.join(search.lower().split())
+
+def _match_expression(search):
+    # Phrase query where the last word may be incomplete, close enough to the forum's substring search.
+    return '"' + search.replace('"', '""') + '" *'
+
+class TransactionHistory(SQLiteStore):
+    """
+    Local copy of every TG transaction the cog has seen, with a full text index over the transaction notes.
+
+    The forum's own answer to every search is kept as well: `search_results` holds the transactions each (normalized)
+    search returned, in the forum's order. Fresh searches are answered from there - the full text index only approximates
+    the forum's matching and is only used to search the whole history.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            sender TEXT NOT NULL,
+            receiver TEXT NOT NULL,
+            tg TEXT NOT NULL,
+            note TEXT NOT NULL,
+            date TEXT NOT NULL,
+            timestamp INTEGER,
+            UNIQUE (sender, receiver, tg, note, date)
+        );
+        CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp);
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(note, content='transactions', content_rowid='id');
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts (rowid, note) VALUES (new.id, new.note);
+        END;
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, note) VALUES ('delete', old.id, old.note);
+        END;
+        CREATE TABLE IF NOT EXISTS searches (
+            search TEXT PRIMARY KEY,
+            pages INTEGER NOT NULL,
+            exhausted INTEGER NOT NULL,
+            fetched_at INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS search_results (
+            search TEXT NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            page INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (search, transaction_id)
+        ) WITHOUT ROWID;
+    '''
+
+    async def add(self, transactions):
+        await self.run(self._add, transactions)
+
+    async def add_results(self, search, page, transactions):
+        """
+        Stores the transactions the forum returned on `page` of `search`.
+
+        Pages must be added in order - the first page replaces everything stored for the search before.
+        """
+
+        await self.run(self._add_results, normalize_search(search), page, transactions)
+
+    async def results(self, search, limit=None):
+        """Returns the transactions the forum returned for `search` the last time it was asked, in the forum's order."""
+
+        query = 'SELECT t.sender, t.receiver, t.tg, t.note, t.date FROM search_results r JOIN transactions t ON t.id = r.transaction_id WHERE r.search = ? ORDER BY r.page, r.position'
+        params = [normalize_search(search)]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        return await self.run(lambda connection: [Transaction(*row) for row in connection.execute(query, params)])
+
+    async def mark_searched(self, search, pages, exhausted):
+        """Records that the first `pages` forum pages of `search` are stored locally (`exhausted` - there are no more)."""
+
+        await self.run(self._mark_searched, normalize_search(search), pages, exhausted)
+
+    async def is_fresh(self, search, pages, max_age):
+        """Whether the local store can answer a `pages` long search without asking the forum."""
+
+        row = await self.run(lambda connection: connection.execute('SELECT pages, exhausted, fetched_at FROM searches WHERE search = ?', (normalize_search(search),)).fetchone())
+        if row is None:
+            return False
+
+        stored_pages, exhausted, fetched_at = row
+        return time.time() - fetched_at < max_age and (bool(exhausted) or stored_pages >= pages)
+
+    async def search(self, search, since=None, limit=None):
+        """Returns the stored transactions matching `search`, newest first."""
+
+        return await self.run(self._search, search, since, limit)
+
+    async def stats(self):
+        return await self.run(lambda connection: (
+            connection.execute('SELECT COUNT(*) FROM transactions').fetchone()[0],
+            connection.execute('SELECT COUNT(*) FROM searches').fetchone()[0]
+        ))
+
+    def _add(self, connection, transactions):
+        connection.executemany(
+            'INSERT OR IGNORE INTO transactions (sender, receiver, tg, note, date, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+            [(t.sender, t.receiver, t.tg, t.note, t.date, parse_transaction_date(t.date)) for t in transactions]
+        )
+
+    def _add_results(self, connection, search, page, transactions):
+        if page == 0:
+            connection.execute('DELETE FROM search_results WHERE search = ?', (search,))
+
+        self._add(connection, transactions)
+        rows = []
+        for position, t in enumerate(transactions):
+            transaction_id, = connection.execute(
+                'SELECT id FROM transactions WHERE sender = ? AND receiver = ? AND tg = ? AND note = ? AND date = ?',
+                (t.sender, t.receiver, t.tg, t.note, t.date)
+            ).fetchone()
+            rows.append((search, transaction_id, page, position))
+
+        connection.executemany('INSERT OR IGNORE INTO search_results (search, transaction_id, page, position) VALUES (?, ?, ?, ?)', rows)
+
+    def _mark_searched(self, connection, search, pages, exhausted):
+        connection.execute(
+            'INSERT OR REPLACE INTO searches (search, pages, exhausted, fetched_at) VALUES (?, ?, ?, ?)',
+            (search, pages, int(exhausted), int(time.time()))
+        )
+
+    def _search(self, connection, search, since, limit):
+        query = 'SELECT t.sender, t.receiver, t.tg, t.note, t.date FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid WHERE transactions_fts MATCH ?'
+        params = [_match_expression(search)]
+        if since is not None:
+            query += ' AND t.timestamp >= ?'
+            params.append(int(since))
+
+        query += ' ORDER BY t.timestamp IS NULL, t.timestamp DESC, t.id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        return [Transaction(*row) for row in connection.execute(query, params)]
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import pathlib
+import random
+import shutil
+import uuid
+from .constants import CRAFTED_IMAGE_UPLOAD_CONCURRENCY, CRAFTED_IMAGE_UPLOAD_TIMEOUT, IMAGE_UPLOAD_ATTEMPTS, IMAGE_UPLOAD_BACKOFF
+
+log = logging.getLogger('red.baiumbg.mxl')
+
+class ImageHost:
+    """
+    Where the rendered item images are uploaded to.
+
+    Implementations provide `name`, which keys their links in the image links store, and `upload`, which uploads one
+    image file and returns its link. `upload_many` runs up to `concurrency` uploads at once and retries failed ones with
+    exponential backoff.
+    """
+
+    name = None
+
+    def __init__(self, concurrency=CRAFTED_IMAGE_UPLOAD_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(self, image_file):
+        raise NotImplementedError
+
+    async def upload_many(self, image_files):
+        """Uploads the images, returns their links in the same order - None for the ones that couldn't be uploaded."""
+
+        return await asyncio.gather(*(self._upload_with_retries(image_file) for image_file in image_files))
+
+    async def _upload_with_retries(self, image_file):
+        for attempt in range(IMAGE_UPLOAD_ATTEMPTS):
+            try:
+                async with self._semaphore:
+                    return await asyncio.wait_for(self.upload(image_file), CRAFTED_IMAGE_UPLOAD_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if attempt == IMAGE_UPLOAD_ATTEMPTS - 1:
+                    log.exception(f'Uploading {image_file} to {self.name} failed.')
+                    return None
+
+            # Jittered, so images that failed together don't all retry at the same moment.
+            await asyncio.sleep(IMAGE_UPLOAD_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+class FlickrImageHost(ImageHost):
+    """
+    Uploads to the authorized flickr account, the link is the largest size flickr offers.
+
+    The upload of every file is kept, so a retry doesn't upload the photo again: after a failed size lookup it reuses the
+    photo id, after a timeout it waits for the upload that is still running on its thread.
+    """
+
+    name = 'flickr'
+
+    def __init__(self, flickr_client, concurrency=CRAFTED_IMAGE_UPLOAD_CONCURRENCY):
+        super().__init__(concurrency)
+        self._flickr_client = flickr_client
+        self._uploads = {}
+
+    async def upload(self, image_file):
+        # flickrapi is blocking.
+        loop = asyncio.get_event_loop()
+        image_file = str(image_file)
+        if image_file not in self._uploads:
+            self._uploads[image_file] = loop.run_in_executor(None, self._upload, image_file)
+
+        upload = self._uploads[image_file]
+        try:
+            # Shielded - the timeout only cancels this attempt, the thread keeps uploading either way.
+            photo_id = await asyncio.shield(upload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Only a failed upload is started over.
+            if self._uploads.get(image_file) is upload:
+                del self._uploads[image_file]
+            raise
+
+        return await loop.run_in_executor(None, self._largest_size, photo_id)
+
+    def _upload(self, image_file):
+        return self._flickr_client.upload(image_file).photoid[0].text
+
+    def _largest_size(self, photo_id):
+        return self._flickr_client.photos.getSizes(photo_id=photo_id).sizes[0].size[-1]['source']
+
+class LocalImageHost(ImageHost):
+    """
+    Copies the images into `directory`, which is expected to be served at `base_url`.
+
+    Doubles as an offline stand-in for flickr - `latency` adds that many seconds to every upload.
+    """
+
+    name = 'local'
+
+    def __init__(self, directory, base_url, latency=0, concurrency=CRAFTED_IMAGE_UPLOAD_CONCURRENCY):
+        super().__init__(concurrency)
+        self.directory = pathlib.Path(directory)
+        self.base_url = base_url.rstrip('/')
+        self.latency = latency
+
+    async def upload(self, image_file):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        return await asyncio.get_event_loop().run_in_executor(None, self._copy, pathlib.Path(image_file))
+
+    def _copy(self, image_file):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = self.directory / f'.{uuid.uuid4().hex}-{image_file.name}'
+        shutil.copyfile(image_file, temporary)
+        os.replace(temporary, self.directory / image_file.name)
+        return f'{self.base_url}/{image_file.name}'
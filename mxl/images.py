@@ -0,0 +1,199 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+from bs4 import BeautifulSoup
+from .constants import CRAFTED_IMAGE_RENDER_BATCH, CRAFTED_IMAGE_SHEET_WIDTH, CRAFTED_IMAGE_WAIT_TIMEOUT
+
+log = logging.getLogger('red.baiumbg.mxl')
+
+def normalize_item_html(html):
+    """Turns an item's armory HTML into the tooltip that's rendered - absolute image links, no gear image, no wrapping."""
+
+    tag = BeautifulSoup(html, 'html.parser').find()
+    if tag.find(class_='gear_img'):
+        tag.img.extract()
+    else:
+        tag.img['src'] = f'https://tsw.vn.cz/acc/{tag.img["src"]}'
+        tag.span.extract()
+
+    tag.div['style'] = 'display: block; white-space: nowrap;'
+    return str(tag)
+
+def image_key(normalized_html):
+    return hashlib.md5(normalized_html.encode()).hexdigest()
+
+def _normalize_all(htmls):
+    normalized = {}
+    for html in htmls:
+        if html not in normalized:
+            normalized_html = normalize_item_html(html)
+            normalized[html] = (image_key(normalized_html), normalized_html)
+
+    return normalized
+
+def _wait(result):
+    try:
+        return result.result(timeout=CRAFTED_IMAGE_WAIT_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        log.warning('Timed out waiting for a crafted item image.')
+        return None
+
+def sprite_sheet(tooltips):
+    """Tiles normalized tooltips left to right, top to bottom, into one image's HTML."""
+
+    tiles = ''.join(f'<div style="display: inline-block; vertical-align: top; margin: 2px;">{tooltip}</div>' for tooltip in tooltips)
+    return f'<div style="max-width: {CRAFTED_IMAGE_SHEET_WIDTH}px;">{tiles}</div>'
+
+def _sprite_sheets(normalized, sheet_size):
+    # Every item is mapped to the (key, HTML) of the sheet its tooltip ended up on instead of its own.
+    tooltips = list(dict.fromkeys(normalized_html for _, normalized_html in normalized.values()))
+    sheets = {}
+    for start in range(0, len(tooltips), sheet_size):
+        sheet_html = sprite_sheet(tooltips[start:start + sheet_size])
+        for tooltip in tooltips[start:start + sheet_size]:
+            sheets[tooltip] = (image_key(sheet_html), sheet_html)
+
+    return {html: sheets[normalized_html] for html, (_, normalized_html) in normalized.items()}
+
+class ItemImages:
+    """
+    Renders and uploads the crafted item images in the background while the trade post is being generated.
+
+    Every distinct image (by the MD5 of its normalized HTML) is uploaded to `host` (an ImageHost) once and only if `links`
+    (an ImageLinks store) has no link for it on that host yet - new links are stored as soon as their batch is uploaded.
+    Renders are kept in `render_cache` under the same key, so an image whose upload failed isn't rendered again - they're
+    pinned there until their upload is over, so the cache can't evict a file the host has yet to read.
+    The images that aren't in `render_cache` are rendered by `renderer` in batches, each batch is uploaded as soon as
+    it's stored.
+    The trade post generator, running on a worker thread, waits for the images it needs with `result`.
+
+    With a `sheet_size` the tooltips are tiled onto sprite sheets of up to that many tooltips instead, and every sheet is
+    rendered and uploaded as one image - `results` returns the sheets.
+    """
+
+    def __init__(self, host, renderer, render_cache, links, sheet_size=0):
+        self.uploaded = {}
+        self.sheet_size = sheet_size
+        self._host = host
+        self._renderer = renderer
+        self._render_cache = render_cache
+        self._links = links
+        self._keys = {}
+        self._results = {}
+        self._tasks = []
+        self._pinned = set()
+
+    async def schedule(self, htmls):
+        """Deduplicates the items' HTML and starts rendering and uploading the images that aren't cached."""
+
+        loop = asyncio.get_event_loop()
+        normalized = await loop.run_in_executor(None, _normalize_all, list(htmls))
+        if self.sheet_size:
+            normalized = await loop.run_in_executor(None, _sprite_sheets, normalized, self.sheet_size)
+
+        links = await self._links.get_many(self._host.name, (key for key, _ in normalized.values()))
+        pending = []
+        for html, (key, normalized_html) in normalized.items():
+            self._keys[html] = key
+            if key in self._results:
+                continue
+
+            result = concurrent.futures.Future()
+            self._results[key] = result
+            if key in links:
+                result.set_result((key, links[key], False))
+                continue
+
+            pending.append((key, normalized_html, result))
+
+        if pending:
+            self._pin([key for key, _, _ in pending])
+            self._tasks.append(loop.create_task(self._render_all(pending)))
+
+    def result(self, html):
+        """
+        Waits for an item's image - only call from a worker thread, never from the event loop.
+
+        The rendering and uploading use the default executor, so the waiting thread must not be one of its workers.
+        Returns (key, link, uploaded by this run) or None if the image couldn't be uploaded in time.
+        """
+
+        return _wait(self._results[self._keys[html]])
+
+    def results(self):
+        """Waits for every image, in the order they were scheduled - same rules as `result`."""
+
+        return [_wait(self._results[key]) for key in dict.fromkeys(self._keys.values())]
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+        self._unpin(list(self._pinned))
+
+        # Nothing may be left waiting for a job that won't finish anymore.
+        for result in self._results.values():
+            if not result.done():
+                result.set_result(None)
+
+    async def _render_all(self, pending):
+        loop = asyncio.get_event_loop()
+        image_files = await loop.run_in_executor(None, lambda: [self._render_cache.get(key) for key, _, _ in pending])
+        rendered, unrendered = [], []
+        for (key, normalized_html, result), image_file in zip(pending, image_files):
+            if image_file is None:
+                unrendered.append((key, normalized_html, result))
+            else:
+                rendered.append((key, image_file, result))
+
+        if rendered:
+            self._tasks.append(loop.create_task(self._upload_batch(rendered)))
+
+        batches = [unrendered[start:start + CRAFTED_IMAGE_RENDER_BATCH] for start in range(0, len(unrendered), CRAFTED_IMAGE_RENDER_BATCH)]
+        await asyncio.gather(*(self._render_batch(batch) for batch in batches))
+
+    async def _render_batch(self, batch):
+        loop = asyncio.get_event_loop()
+        try:
+            images = await self._renderer.render([normalized_html for _, normalized_html, _ in batch])
+            image_files = await loop.run_in_executor(None, lambda: [self._render_cache.put(key, image) for (key, _, _), image in zip(batch, images)])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception('Rendering crafted item images failed.')
+            self._unpin([key for key, _, _ in batch])
+            for _, _, result in batch:
+                result.set_result(None)
+            return
+
+        self._tasks.append(loop.create_task(self._upload_batch([(key, image_file, result) for (key, _, result), image_file in zip(batch, image_files)])))
+
+    def _pin(self, keys):
+        self._pinned.update(keys)
+        self._render_cache.pin(keys)
+
+    def _unpin(self, keys):
+        # Every key is released once, whether its upload finished or the post was cancelled first.
+        keys = [key for key in keys if key in self._pinned]
+        self._pinned.difference_update(keys)
+        self._render_cache.unpin(keys)
+
+    async def _upload_batch(self, batch):
+        try:
+            links = await self._host.upload_many([image_file for _, image_file, _ in batch])
+        finally:
+            self._unpin([key for key, _, _ in batch])
+
+        uploaded = {key: link for (key, _, _), link in zip(batch, links) if link is not None}
+        try:
+            await self._links.put_many(self._host.name, uploaded)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The links still work for this post, they're just uploaded again next time.
+            log.exception('Storing crafted item image links failed.')
+
+        self.uploaded.update(uploaded)
+        for key, _, result in batch:
+            result.set_result((key, uploaded[key], True) if key in uploaded else None)
@@ -0,0 +1,97 @@
+import time
+from .storage import SQLiteStore
+
+# SQLite limits the number of parameters of a query, lookups are split into batches of this size.
+LOOKUP_BATCH_SIZE = 500
+
+class ImageLinks(SQLiteStore):
+    """
+    Links of the uploaded item images, by image host and image key (the MD5 of the item's normalized HTML).
+
+    Every upload is written on its own. Links that weren't used for `max_age` seconds are dropped when they're looked up
+    and only the `max_entries` most recently used links are kept - 0 disables either limit. Dropping a link doesn't delete
+    the image from its host, the image is just uploaded again the next time it's needed.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS image_links (
+            host TEXT NOT NULL,
+            key TEXT NOT NULL,
+            link TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            used_at INTEGER NOT NULL,
+            PRIMARY KEY (host, key)
+        );
+        CREATE INDEX IF NOT EXISTS image_links_used_at ON image_links (host, used_at);
+    '''
+
+    def __init__(self, path, max_entries=0, max_age=0):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    async def get_many(self, host, keys):
+        """Returns {key: link} of the `keys` that have a link and marks them as used."""
+
+        keys = list(dict.fromkeys(keys))
+        links = await self.run(self._get_many, host, keys)
+        self.hits += len(links)
+        self.misses += len(keys) - len(links)
+        return links
+
+    async def put(self, host, key, link):
+        await self.run(self._put_many, host, {key: link})
+
+    async def put_many(self, host, links):
+        await self.run(self._put_many, host, links)
+
+    async def page(self, host, page, page_size):
+        """Returns the (key, link) pairs of the page (counted from 0), ordered by key, and the total number of links."""
+
+        return await self.run(lambda connection: (
+            connection.execute('SELECT key, link FROM image_links WHERE host = ? ORDER BY key LIMIT ? OFFSET ?', (host, page_size, page * page_size)).fetchall(),
+            connection.execute('SELECT COUNT(*) FROM image_links WHERE host = ?', (host,)).fetchone()[0]
+        ))
+
+    async def stats(self, host):
+        """Returns the number of links and the oldest link's creation timestamp."""
+
+        return await self.run(lambda connection: connection.execute('SELECT COUNT(*), MIN(created_at) FROM image_links WHERE host = ?', (host,)).fetchone())
+
+    async def clear(self, host):
+        await self.run(lambda connection: connection.execute('DELETE FROM image_links WHERE host = ?', (host,)))
+        self.hits = 0
+        self.misses = 0
+
+    def _get_many(self, connection, host, keys):
+        now = int(time.time())
+        if self.max_age:
+            connection.execute('DELETE FROM image_links WHERE host = ? AND used_at < ?', (host, now - self.max_age))
+
+        links = {}
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            links.update(connection.execute(f'SELECT key, link FROM image_links WHERE host = ? AND key IN ({placeholders})', [host] + batch))
+            connection.execute(f'UPDATE image_links SET used_at = ? WHERE host = ? AND key IN ({placeholders})', [now, host] + batch)
+
+        return links
+
+    def _put_many(self, connection, host, links):
+        now = int(time.time())
+        connection.executemany(
+            'INSERT OR REPLACE INTO image_links (host, key, link, created_at, used_at) VALUES (?, ?, ?, ?, ?)',
+            [(host, key, link, now, now) for key, link in links.items()]
+        )
+        if self.max_entries:
+            connection.execute(
+                'DELETE FROM image_links WHERE host = ? AND key NOT IN (SELECT key FROM image_links WHERE host = ? ORDER BY used_at DESC LIMIT ?)',
+                (host, host, self.max_entries)
+            )
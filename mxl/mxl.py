@@ -2,28 +2,76 @@ from redbot.core import commands, checks, Config, data_manager
 from redbot.core.utils.chat_formatting import pagify
 import discord
 import random
-import requests
-import re
+import aiohttp
+import asyncio
+import codecs
+import concurrent.futures
+import functools
+import hashlib
 import enum
+import logging
+import time
 import flickrapi
 from bs4 import BeautifulSoup
 from .pastebin import PasteBin
-from .constants import SU_ITEMS, SSU_ITEMS, SSSU_ITEMS, SETS, AMULETS, RINGS, JEWELS, \
-                       MOS, RUNEWORDS, IGNORED_ITEMS, SHRINE_VESSELS, WHITE_IGNORED_ITEMS, \
-                       VESSEL_TO_SHRINE, QUIVERS, CHARMS, TROPHIES, ORANGE_IGNORED_ITEMS
-from .dclasses import ItemDump, PostGenerationErrors
+from .auctions import AuctionFeed, AuctionIndex, AuctionDiffer, parse_auction
+from .constants import PRICECHECK_PAGE_SIZE, PRICECHECK_MAX_PAGES, PRICECHECK_CONCURRENT_PAGES, \
+                       HISTORY_CRAWL_PAGES, ARMORY_CONCURRENT_FETCHES, ARMORY_CHUNK_SIZE, PASTEBIN_LIMIT_COOLDOWN, \
+                       CRAFTED_IMAGE_RENDER_WORKERS, CRAFTED_IMAGE_SHEET_SIZE, CRAFTED_IMAGE_UPLOAD_TIMEOUT, \
+                       FLICKR_CACHE_PAGE_SIZE, TRADE_POST_WORKERS
+from .cache import TTLCache, RenderCache
+from .history import TransactionHistory
+from .pricestats import summarize
+from .dclasses import ItemDump, PostGenerationErrors, Transaction, RENDERED_BUCKETS
+from .classifier import ITEM_RULES
+from .armory import ArmoryPage, parse_armory_page
+from .images import ItemImages
+from .hosts import FlickrImageHost, LocalImageHost
+from .renderer import ItemRenderer
+from .links import ImageLinks
+from .snapshots import CharacterSnapshot, CharacterSnapshots, snapshot_variant
 
 class LoginError(enum.Enum):
     NONE = 0
     INCORRECT_USERNAME = 1,
     INCORRECT_PASSWORD = 2,
     LOGIN_ATTEMPTS_EXCEEDED = 3,
-    UNKNOWN = 4
+    UNKNOWN = 4,
+    STILL_LOGGED_OUT = 5
+
+class ArmoryError(enum.Enum):
+    NONE = 0
+    PRIVATE = 1
+    LOGIN_FAILED = 2
+    UNAVAILABLE = 3
+
+log = logging.getLogger('red.baiumbg.mxl')
+
+def _next_section(sections):
+    """Advances a trade post section generator. Returns (section, done, error)."""
+
+    try:
+        return next(sections), False, None
+    except StopIteration as stop:
+        return None, True, stop.value
+
+def _pages_option(item, default):
+    """Splits a leading `--pages N` off a search. Returns (pages, search) - without it the whole text is the search."""
+
+    words = item.split(maxsplit=2)
+    if len(words) == 3 and words[0] == '--pages' and words[1].isdigit():
+        return int(words[1]), words[2]
+
+    return default, item
+
+# Only items of the rendered categories keep their HTML, so only their colors need it sliced out of the page.
+RENDERED_COLORS = frozenset().union(*(ITEM_RULES.colors_for(bucket) for bucket in RENDERED_BUCKETS))
 
 class MXL(commands.Cog):
     """Median XL utilities."""
 
-    def __init__(self):
+    def __init__(self, bot):
+        self.bot = bot
         self.auctions_endpoint = 'https://forum.median-xl.com/api.php?mode=tradecenter'
         self.tradecenter_enpoint = 'https://forum.median-xl.com/tradegold.php'
         self.forum_login_endpoint = 'https://forum.median-xl.com/ucp.php?mode=login'
@@ -34,6 +82,22 @@ class MXL(commands.Cog):
         self.armory_character_endpoint = 'https://tsw.vn.cz/acc/char.php?name={}'
         self.item_css = (data_manager.bundled_data_path(self) / 'item_style.css').as_posix()
         self.flickr_client = None
+        # One pooled session for the cog's lifetime. Cookies are always passed explicitly from the config,
+        # so the session itself must not remember any.
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, limit_per_host=4),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+        self.pricecheck_cache = TTLCache(maxsize=256)
+        self._pastebin_limited_at = None
+        # wkhtmltoimage runs as a subprocess per image, this bounds how many run at once.
+        self._render_executor = concurrent.futures.ThreadPoolExecutor(max_workers=CRAFTED_IMAGE_RENDER_WORKERS)
+        self.item_renderer = ItemRenderer(self.item_css, self._render_executor)
+        # The trade post generator blocks while it waits for images, which are made on the default executor - it gets
+        # its own threads so that waiting can never starve the default executor.
+        self._trade_post_executor = concurrent.futures.ThreadPoolExecutor(max_workers=TRADE_POST_WORKERS)
+        self.auction_feed = AuctionFeed(self.session, self.auctions_endpoint, lambda raw_auctions: AuctionIndex([parse_auction(auction) for auction in raw_auctions]))
 
         default_config = {
             'forum_username': '',
@@ -51,16 +115,55 @@ class MXL(commands.Cog):
             'pastebin_api_key': '',
             'flickr_api_key': '',
             'flickr_api_secret': '',
-            'flickr_cache': {}
+            # Only read to move old caches into the image links store.
+            'flickr_cache': {},
+            'flickr_cache_max_entries': 0,
+            'flickr_cache_max_age': 0,
+            'image_host': FlickrImageHost.name,
+            'local_image_host_url': '',
+            'auctions_ttl': 60,
+            'auctions_poll_interval': 300,
+            'pricecheck_cache_ttl': 600,
+            'pricecheck_negative_cache_ttl': 120,
+            'history_max_age': 3600,
+            'history_crawl_items': [],
+            'history_crawl_interval': 3600,
+            'render_cache_size': 100
         }
 
         default_member_config = {
             'generate_crafted_images': False,
-            'crafted_as_base': False
+            'crafted_as_base': False,
+            'crafted_images_sprite_sheet': False,
+            'armory_characters': []
         }
         self._config = Config.get_conf(self, identifier=134621854878007298)
         self._config.register_global(**default_config)
         self._config.register_member(**default_member_config)
+        self._config.register_channel(auction_notifications=False)
+
+        self.auction_differ = AuctionDiffer()
+        self._auction_poller = asyncio.get_event_loop().create_task(self._poll_auctions())
+
+        self.transaction_history = TransactionHistory(data_manager.cog_data_path(self) / 'transactions.db')
+        self._transaction_crawler = asyncio.get_event_loop().create_task(self._crawl_transactions())
+
+        self.character_snapshots = CharacterSnapshots(data_manager.cog_data_path(self) / 'armory.db')
+        self.image_links = ImageLinks(data_manager.cog_data_path(self) / 'images.db')
+        self._flickr_cache_migration = asyncio.get_event_loop().create_task(self._migrate_flickr_cache())
+        self.render_cache = RenderCache(data_manager.cog_data_path(self) / 'renders', default_config['render_cache_size'] * 1024 * 1024)
+
+    def cog_unload(self):
+        self._auction_poller.cancel()
+        self._transaction_crawler.cancel()
+        self.transaction_history.close()
+        self.character_snapshots.close()
+        self._flickr_cache_migration.cancel()
+        self.image_links.close()
+        self._render_executor.shutdown(wait=False)
+        self._trade_post_executor.shutdown(wait=False)
+        asyncio.get_event_loop().create_task(self.item_renderer.close())
+        asyncio.get_event_loop().create_task(self.session.close())
 
     @commands.guild_only()
     @commands.group(name="mxl")
@@ -83,37 +186,36 @@ class MXL(commands.Cog):
 
         If there are more than 5 active auctions, prints them in a DM instead.
         """
-        api_response = requests.get(self.auctions_endpoint)
-        if api_response.status_code != 200:
+        auctions = await self.auction_feed.get(await self._config.auctions_ttl())
+        if auctions is None:
             await ctx.send('Couldn\'t contact the MXL API. Try again later.')
             return
 
-        embeds = self._get_auction_embeds(api_response.json()['auctions'])
-        if not embeds:
+        if not auctions:
             await ctx.send('There are no active auctions at the moment.')
             return
 
         channel = ctx.channel
-        if len(embeds) > 5:
+        if len(auctions) > 5:
             channel = ctx.author.dm_channel or await ctx.author.create_dm()
 
-        for embed in embeds:
-            await channel.send(embed=embed)
+        for auction in auctions:
+            await channel.send(embed=auction.to_embed())
 
     @auctions.command(name="search")
     async def auctions_search(self, ctx, *, title: str):
         """
-        Searches the titles of the currently active auctions and prints the results.
+        Searches the titles and sellers of the currently active auctions and prints the results.
 
+        The search is a case-insensitive substring match.
         If there are more than 5 results, prints them in a DM instead.
         """
-        api_response = requests.get(self.auctions_endpoint)
-        if api_response.status_code != 200:
+        auctions = await self.auction_feed.get(await self._config.auctions_ttl())
+        if auctions is None:
             await ctx.send('Couldn\'t contact the MXL API. Try again later.')
             return
 
-        embeds = self._get_auction_embeds(api_response.json()['auctions'])
-        matching_auctions = [embed for embed in embeds if re.search(title, embed.title, re.IGNORECASE)]
+        matching_auctions = auctions.search(title)
         if not matching_auctions:
             await ctx.send('There are no active auctions that match that description at the moment.')
             return
@@ -122,8 +224,28 @@ class MXL(commands.Cog):
         if len(matching_auctions) > 5:
             channel = ctx.author.dm_channel or await ctx.author.create_dm()
 
-        for embed in matching_auctions:
-            await channel.send(embed=embed)
+        for auction in matching_auctions:
+            await channel.send(embed=auction.to_embed())
+
+    @auctions.command(name="subscribe")
+    @checks.admin_or_permissions(manage_channels=True)
+    async def auctions_subscribe(self, ctx):
+        """
+        Posts auction updates in the current channel.
+
+        New auctions, new bids and auctions that are about to end get posted as they are noticed.
+        """
+
+        await self._config.channel(ctx.channel).auction_notifications.set(True)
+        await ctx.send('This channel will now receive auction updates.')
+
+    @auctions.command(name="unsubscribe")
+    @checks.admin_or_permissions(manage_channels=True)
+    async def auctions_unsubscribe(self, ctx):
+        """Stops posting auction updates in the current channel."""
+
+        await self._config.channel(ctx.channel).auction_notifications.set(False)
+        await ctx.send('This channel will no longer receive auction updates.')
 
     @mxl.group(name="config")
     @checks.is_owner()
@@ -225,6 +347,75 @@ class MXL(commands.Cog):
         await ctx.message.delete()
         await ctx.send('Flickr API secret set successfully.')
 
+    @config.command(name="image_host")
+    async def image_host(self, ctx, host: str = None):
+        """
+        Gets/sets where crafted item images are uploaded to - `flickr` or `local`.
+
+        `local` copies the images into the cog's data folder, which has to be served at `local_image_host_url`.
+        """
+
+        if host is None:
+            current_host = await self._config.image_host()
+            await ctx.send(f'Current image host: {current_host}')
+            return
+
+        if host not in (FlickrImageHost.name, LocalImageHost.name):
+            await ctx.send(f'Unknown image host - use `{FlickrImageHost.name}` or `{LocalImageHost.name}`.')
+            return
+
+        await self._config.image_host.set(host)
+        await ctx.send(f'Image host set to {host}.')
+
+    @config.command(name="local_image_host_url")
+    async def local_image_host_url(self, ctx, url: str = None):
+        """Gets/sets the URL the local image host's folder is served at."""
+
+        if url is None:
+            current_url = await self._config.local_image_host_url()
+            await ctx.send(f'Current local image host URL: {current_url}')
+            return
+
+        await self._config.local_image_host_url.set(url)
+        await ctx.send('Local image host URL set successfully.')
+
+    @config.command(name="auctions_ttl")
+    async def auctions_ttl(self, ctx, seconds: int = None):
+        """
+        Gets/sets how long (in seconds) the fetched auctions are reused before asking the MXL API again.
+
+        Set to 0 to always fetch fresh auctions.
+        """
+
+        if seconds is None:
+            current_ttl = await self._config.auctions_ttl()
+            await ctx.send(f'Current auctions TTL: {current_ttl}s')
+            return
+
+        if seconds < 0:
+            await ctx.send('The TTL can\'t be negative.')
+            return
+
+        await self._config.auctions_ttl.set(seconds)
+        self.auction_feed.invalidate()
+        await ctx.send('Auctions TTL set successfully.')
+
+    @config.command(name="auctions_poll_interval")
+    async def auctions_poll_interval(self, ctx, seconds: int = None):
+        """Gets/sets how often (in seconds) the auctions are checked for updates for subscribed channels."""
+
+        if seconds is None:
+            current_interval = await self._config.auctions_poll_interval()
+            await ctx.send(f'Current auctions poll interval: {current_interval}s')
+            return
+
+        if seconds < 30:
+            await ctx.send('The poll interval must be at least 30 seconds.')
+            return
+
+        await self._config.auctions_poll_interval.set(seconds)
+        await ctx.send('Auctions poll interval set successfully.')
+
     @mxl.group(name="uconfig", invoke_without_command=True)
     async def uconfig(self, ctx):
         """Configures user options."""
@@ -250,17 +441,29 @@ class MXL(commands.Cog):
         Images are generated for every crafted item in the supplied characters' inventories when enabled.
 
         No effect if `crafted_as_base` is enabled.
-        Warning: Do not use with large amounts of crafted items - the command will most likely fail and will make the bot reconnect to Discord.
+        Images are rendered and uploaded in the background, each distinct image only once - large amounts of crafted items only make the dump slower.
         """
         await self._config.member(ctx.author).generate_crafted_images.set(enabled)
         await ctx.send(f'generate_crafted_images {"enabled" if enabled else "disabled"}.')
 
-    @mxl.command(name="pricecheck", aliases=["pc"])
+    @uconfig.command(name="crafted_images_sprite_sheet")
+    async def crafted_images_sprite_sheet(self, ctx, enabled: bool):
+        """
+        Crafted item images are tiled onto a few sprite sheets instead of one image per item when enabled.
+
+        Only has an effect if `generate_crafted_images` is enabled.
+        A dump then uploads one image per 24 distinct crafted items, posted below the crafted item list.
+        """
+        await self._config.member(ctx.author).crafted_images_sprite_sheet.set(enabled)
+        await ctx.send(f'crafted_images_sprite_sheet {"enabled" if enabled else "disabled"}.')
+
+    @mxl.command(name="pricecheck", aliases=["pc"], usage='[--pages N] <item>')
     async def pricecheck(self, ctx, *, item: str):
         """
         Checks all TG transactions for the provided item/string.
 
-        Note: Only looks at the first 25 results.
+        Every page holds 25 transactions, newest first. Up to 10 pages can be checked at once with `--pages N` - they are fetched in parallel and posted as soon as they arrive.
+        Searches that were fetched recently are answered from the local transaction history instead.
         """
 
         config = await self._config.all()
@@ -268,52 +471,283 @@ class MXL(commands.Cog):
             await ctx.send(f'No forum account is currently configured for this server. Use `{ctx.prefix}mxl config` to set one up.')
             return
 
-        def not_logged_in_function(tag):
-            return 'We\'re sorry' in tag.text
+        pages, item = _pages_option(item, 1)
+        pages = max(1, min(pages, PRICECHECK_MAX_PAGES))
+        if await self.transaction_history.is_fresh(item, pages, config['history_max_age']):
+            transactions = await self.transaction_history.results(item, limit=pages * PRICECHECK_PAGE_SIZE)
+            if transactions:
+                await self._send_transactions(ctx, item, transactions)
+            else:
+                await ctx.send('No results found.')
+            return
 
-        def no_transactions_found(tag):
-            return 'No transactions found.' in tag.text
+        error, found = await self._walk_transaction_pages(item, config, pages, functools.partial(self._send_transactions, ctx, item))
+        if error != LoginError.NONE:
+            await self._send_login_error(ctx, error)
+            return
 
-        def escape_underscore(text):
-            return text.replace('_', '\\_')
+        if not found:
+            await ctx.send('No results found.')
 
-        pricecheck_response = requests.post(self.tradecenter_enpoint, data={'search': item, 'submit': ''}, cookies=config['forum_cookies'])
-        dom = BeautifulSoup(pricecheck_response.text, 'html.parser')
-        if dom.find(not_logged_in_function):
-            error, config = await self._forum_login()
-            if error == LoginError.INCORRECT_USERNAME:
-                await ctx.send(f'Incorrect forum username. Please set a valid one using `{ctx.prefix}mxl config username`.')
-                return
-            elif error == LoginError.INCORRECT_PASSWORD:
-                await ctx.send(f'Incorrect forum password. Please set the proper one using `{ctx.prefix}mxl config password`.')
-                return
-            elif error == LoginError.LOGIN_ATTEMPTS_EXCEEDED:
-                await ctx.send(f'Maximum login attempts exceeded. Please login to the forum manually (with the configured account) and solve the CAPTCHA.')
+    @mxl.command(name="pricestats", aliases=["ps"], usage='[--pages N] <item>')
+    async def pricestats(self, ctx, *, item: str):
+        """
+        Summarizes the TG prices of the provided item/string in a single embed.
+
+        The newest 4 pages of transactions are used, up to 10 with `--pages N`.
+        Prices are divided by the quantity in the transaction note (`2x ...`, `... x2`, `10 ...`).
+        The mean and the weekly averages ignore prices outside 1.5 IQR of the quartiles.
+        """
+
+        config = await self._config.all()
+        if not config['forum_username']:
+            await ctx.send(f'No forum account is currently configured for this server. Use `{ctx.prefix}mxl config` to set one up.')
+            return
+
+        pages, item = _pages_option(item, 4)
+        pages = max(1, min(pages, PRICECHECK_MAX_PAGES))
+        if not await self.transaction_history.is_fresh(item, pages, config['history_max_age']):
+            error, _ = await self._walk_transaction_pages(item, config, pages)
+            if error != LoginError.NONE:
+                await self._send_login_error(ctx, error)
                 return
-            elif error == LoginError.UNKNOWN:
-                await ctx.send('Unknown error during login.')
+
+        transactions = await self.transaction_history.results(item, limit=pages * PRICECHECK_PAGE_SIZE)
+        summary = summarize(transactions)
+        if summary is None:
+            await ctx.send('No priced transactions found.')
+            return
+
+        def tg(value):
+            return f'{value:,.0f} TG' if value is not None else '-'
+
+        embed = discord.Embed(title=f'Prices for {item}', description=f'Based on {summary.priced} of {summary.transactions} transactions.')
+        embed.add_field(name='Median', value=tg(summary.median))
+        embed.add_field(name='IQR', value=f'{tg(summary.q1)} - {tg(summary.q3)}')
+        embed.add_field(name='Mean (without outliers)', value=tg(summary.mean))
+        embed.add_field(name='Range', value=f'{tg(summary.low)} - {tg(summary.high)}')
+        embed.add_field(name='Weekly averages', value='\n'.join(f'{weeks_ago} week(s) ago: {tg(average)}' if weeks_ago else f'This week: {tg(average)}' for weeks_ago, average in summary.rolling), inline=False)
+        await ctx.send(embed=embed)
+
+    @mxl.command(name="pchistory", usage='<days> <item>')
+    async def pricecheck_history(self, ctx, days: int, *, item: str):
+        """
+        Searches the locally stored TG transactions from the last <days> days.
+
+        Only transactions that were previously fetched by `[p]mxl pricecheck` or the transaction crawler are searched - the forum is not contacted.
+        """
+
+        since = time.time() - days * 86400
+        transactions = await self.transaction_history.search(item, since=since, limit=PRICECHECK_MAX_PAGES * PRICECHECK_PAGE_SIZE)
+        if not transactions:
+            await ctx.send(f'No stored transactions from the last {days} days match that search.')
+            return
+
+        await self._send_transactions(ctx, item, transactions)
+
+    @mxl.group(name="pcwatch")
+    @checks.is_owner()
+    async def pricecheck_watch(self, ctx):
+        """Manages the items that are periodically crawled into the local transaction history."""
+
+        pass
+
+    @pricecheck_watch.command(name="add")
+    async def pricecheck_watch_add(self, ctx, *, item: str):
+        """Adds an item/string to the transaction crawler."""
+
+        async with self._config.history_crawl_items() as crawl_items:
+            if item in crawl_items:
+                await ctx.send(f'`{item}` is already being crawled.')
                 return
 
-            pricecheck_response = requests.post(self.tradecenter_enpoint, data={'search': item, 'submit': ''}, cookies=config['forum_cookies'])
-            dom = BeautifulSoup(pricecheck_response.text, 'html.parser')
-            if dom.find(not_logged_in_function):
-                await ctx.send('Couldn\'t login to the forums. Please report this to the plugin author.')
+            crawl_items.append(item)
+
+        await ctx.send(f'`{item}` will now be crawled.')
+
+    @pricecheck_watch.command(name="remove")
+    async def pricecheck_watch_remove(self, ctx, *, item: str):
+        """Removes an item/string from the transaction crawler."""
+
+        async with self._config.history_crawl_items() as crawl_items:
+            if item not in crawl_items:
+                await ctx.send(f'`{item}` isn\'t being crawled.')
                 return
 
-        if dom.tbody.find(no_transactions_found):
-            await ctx.send('No results found.')
+            crawl_items.remove(item)
+
+        await ctx.send(f'`{item}` will no longer be crawled.')
+
+    @pricecheck_watch.command(name="list")
+    async def pricecheck_watch_list(self, ctx):
+        """Lists the crawled items/strings and the local transaction history size."""
+
+        crawl_items = await self._config.history_crawl_items()
+        transaction_count, search_count = await self.transaction_history.stats()
+        crawled = ', '.join(f'`{item}`' for item in crawl_items) or 'nothing'
+        await ctx.send(f'Crawling: {crawled}\nStored transactions: {transaction_count} (from {search_count} searches)')
+
+    @mxl.group(name="pccache")
+    @checks.is_owner()
+    async def pricecheck_cache_group(self, ctx):
+        """Manages the in-memory pricecheck cache."""
+
+        pass
+
+    @pricecheck_cache_group.command(name="stats")
+    async def pricecheck_cache_stats(self, ctx):
+        """Shows the pricecheck cache size and hit rate."""
+
+        cache = self.pricecheck_cache
+        await ctx.send(f'Cached searches: {len(cache)}/{cache.maxsize}\nHits: {cache.hits}\nMisses: {cache.misses}\nHit rate: {cache.hit_rate:.1%}')
+
+    @pricecheck_cache_group.command(name="clear")
+    async def pricecheck_cache_clear(self, ctx):
+        """Flushes the pricecheck cache."""
+
+        self.pricecheck_cache.clear()
+        await ctx.send('Pricecheck cache cleared successfully.')
+
+    @config.command(name="pricecheck_cache_ttl")
+    async def pricecheck_cache_ttl(self, ctx, seconds: int = None, negative_seconds: int = None):
+        """
+        Gets/sets how long (in seconds) pricecheck results are cached.
+
+        The second value is used for searches that found no transactions.
+        """
+
+        if seconds is None:
+            config = await self._config.all()
+            await ctx.send(f'Current pricecheck cache TTL: {config["pricecheck_cache_ttl"]}s ({config["pricecheck_negative_cache_ttl"]}s for searches without results)')
             return
 
-        pc_results_raw = [item for item in dom.tbody.contents if item != '\n']
-        message = ''
-        for result in pc_results_raw:
-            columns = [column for column in result.contents if column != '\n']
-            message += f'--------------------------\n**Transaction note**: {escape_underscore(columns[3].text)}\n**From**: {escape_underscore(columns[0].a.text)}\n**To**: {escape_underscore(columns[2].a.text)}\n**TG**: {columns[1].div.text}\n**Date**: {columns[4].text}\n'
+        await self._config.pricecheck_cache_ttl.set(seconds)
+        if negative_seconds is not None:
+            await self._config.pricecheck_negative_cache_ttl.set(negative_seconds)
 
-        for page in pagify(message, delims=['--------------------------']):
-            embed = discord.Embed(title=f'Auctions for {item}', description=page)
-            await ctx.send(embed=embed)
+        self.pricecheck_cache.clear()
+        await ctx.send('Pricecheck cache TTL set successfully.')
+
+    @config.command(name="history_max_age")
+    async def history_max_age(self, ctx, seconds: int = None):
+        """
+        Gets/sets how old (in seconds) a locally stored search can be before pricechecks go to the forum again.
+
+        Set to 0 to always ask the forum.
+        """
+
+        if seconds is None:
+            current_max_age = await self._config.history_max_age()
+            await ctx.send(f'Current transaction history max age: {current_max_age}s')
+            return
+
+        await self._config.history_max_age.set(seconds)
+        await ctx.send('Transaction history max age set successfully.')
+
+    @config.command(name="history_crawl_interval")
+    async def history_crawl_interval(self, ctx, seconds: int = None):
+        """Gets/sets how often (in seconds) the items in `[p]mxl pcwatch` are crawled."""
+
+        if seconds is None:
+            current_interval = await self._config.history_crawl_interval()
+            await ctx.send(f'Current transaction crawl interval: {current_interval}s')
+            return
+
+        if seconds < 300:
+            await ctx.send('The crawl interval must be at least 300 seconds.')
+            return
+
+        await self._config.history_crawl_interval.set(seconds)
+        await ctx.send('Transaction crawl interval set successfully.')
+
+    @config.command(name="render_cache_size")
+    async def render_cache_size(self, ctx, megabytes: int = None):
+        """Gets/sets how much disk space the rendered crafted item images may take up."""
+
+        if megabytes is None:
+            current_size = await self._config.render_cache_size()
+            await ctx.send(f'Current render cache size: {current_size} MB')
+            return
+
+        if megabytes < 1:
+            await ctx.send('The render cache needs at least 1 MB.')
+            return
 
+        await self._config.render_cache_size.set(megabytes)
+        self.render_cache.max_bytes = megabytes * 1024 * 1024
+        await ctx.send(f'Render cache size set to {megabytes} MB.')
+
+    @config.command(name="flickr_cache_limits")
+    async def flickr_cache_limits(self, ctx, max_entries: int = None, max_age_days: int = None):
+        """
+        Gets/sets how many flickr links are kept and for how many days an unused link is kept - 0 means no limit.
+
+        Dropped links only mean the image is uploaded again when it's needed, the flickr account isn't touched.
+        """
+
+        if max_entries is None:
+            config = await self._config.all()
+            await ctx.send(f'Current flickr cache limits: {config["flickr_cache_max_entries"]} links, {config["flickr_cache_max_age"]} days')
+            return
+
+        if max_entries < 0 or (max_age_days is not None and max_age_days < 0):
+            await ctx.send('The limits can\'t be negative.')
+            return
+
+        await self._config.flickr_cache_max_entries.set(max_entries)
+        self.image_links.max_entries = max_entries
+        if max_age_days is not None:
+            await self._config.flickr_cache_max_age.set(max_age_days)
+            self.image_links.max_age = max_age_days * 86400
+
+        await ctx.send('Flickr cache limits updated.')
+
+    @mxl.group(name="armorycache")
+    @checks.is_owner()
+    async def armory_cache_group(self, ctx):
+        """Manages the stored armory snapshots the dumps and the inventory view use."""
+
+        pass
+
+    @armory_cache_group.command(name="stats")
+    async def armory_cache_stats(self, ctx):
+        """Shows how many armory snapshots are stored."""
+
+        snapshots, characters = await self.character_snapshots.stats()
+        await ctx.send(f'Armory snapshots: {snapshots}\nCharacters: {characters}')
+
+    @armory_cache_group.command(name="clear")
+    async def armory_cache_clear(self, ctx):
+        """
+        Deletes every armory snapshot.
+
+        The next dump of each character downloads and classifies its page again. The inventory view is empty until then.
+        """
+
+        await self.character_snapshots.clear()
+        await ctx.send('Armory cache cleared successfully.')
+
+    @mxl.group(name="rendercache")
+    @checks.is_owner()
+    async def render_cache_group(self, ctx):
+        """Manages the rendered crafted item images stored on disk."""
+
+        pass
+
+    @render_cache_group.command(name="stats")
+    async def render_cache_stats(self, ctx):
+        """Shows the render cache size and hit rate."""
+
+        cache = self.render_cache
+        size, images = await asyncio.get_event_loop().run_in_executor(None, lambda: (cache.size, len(cache)))
+        await ctx.send(f'Renderer: {self.item_renderer.backend}\nRendered images: {images}\nSize: {size / 1024 / 1024:.1f}/{cache.max_bytes / 1024 / 1024:.0f} MB\nHits: {cache.hits}\nMisses: {cache.misses}\nHit rate: {cache.hit_rate:.1%}')
+
+    @render_cache_group.command(name="clear")
+    async def render_cache_clear(self, ctx):
+        """Deletes the rendered images. Their uploads (and the flickr cache) are not affected."""
+
+        await asyncio.get_event_loop().run_in_executor(None, self.render_cache.clear)
+        await ctx.send('Render cache cleared successfully.')
 
     @mxl.group(name="logout")
     @checks.is_owner()
@@ -335,8 +769,9 @@ class MXL(commands.Cog):
             await ctx.send('Not logged in.')
             return
 
-        logout_response = requests.get(self.forum_logout_endpoint.format(config['forum_cookies']['MedianXL_sid']), cookies=config['forum_cookies'])
-        dom = BeautifulSoup(logout_response.text, 'html.parser')
+        async with self.session.get(self.forum_logout_endpoint.format(config['forum_cookies']['MedianXL_sid']), cookies=config['forum_cookies']) as logout_response:
+            dom = BeautifulSoup(await logout_response.text(), 'html.parser')
+
         if dom.find(title='Login'):
             config['forum_cookies'] = {
                 'MedianXL_u': '',
@@ -366,8 +801,9 @@ class MXL(commands.Cog):
             await ctx.send('Not logged in.')
             return
 
-        logout_response = requests.get(self.armory_logout_endpoint, cookies=config['armory_cookies'])
-        dom = BeautifulSoup(logout_response.text, 'html.parser')
+        async with self.session.get(self.armory_logout_endpoint, cookies=config['armory_cookies']) as logout_response:
+            dom = BeautifulSoup(await logout_response.text(), 'html.parser')
+
         if not dom.find(action='login.php'):
             await ctx.send('Unknown error during armory logout.')
 
@@ -400,54 +836,86 @@ class MXL(commands.Cog):
             await ctx.send(f'Armory account hasn\'t been configured yet. Configure one using `{ctx.prefix}mxl config armory_username/armory_password`.')
             return
 
-        if not config['flickr_api_key'] or not config['flickr_api_secret'] and self.flickr_client is None:
-            await ctx.send(f'Flickr API key/secret hasn\'t been configured yet. Configure using `{ctx.prefix}mxl config flickr_api_key/flickr_api_secret`.')
-            return
+        if config['image_host'] == LocalImageHost.name:
+            if not config['local_image_host_url']:
+                await ctx.send(f'The local image host\'s URL hasn\'t been configured yet. Configure one using `{ctx.prefix}mxl config local_image_host_url`.')
+                return
 
-        if not self.flickr_client:
-            self.flickr_client = flickrapi.FlickrAPI(config['flickr_api_key'], config['flickr_api_secret'], format='xmlnode')
+            image_host = LocalImageHost(data_manager.cog_data_path(self) / 'hosted', config['local_image_host_url'])
+        else:
+            if not config['flickr_api_key'] or not config['flickr_api_secret'] and self.flickr_client is None:
+                await ctx.send(f'Flickr API key/secret hasn\'t been configured yet. Configure using `{ctx.prefix}mxl config flickr_api_key/flickr_api_secret`.')
+                return
 
-        if not self.flickr_client.token_valid(perms='write'):
-            await ctx.send(f'Missing flickr client token. Use `{ctx.prefix}mxl flickr` to configure one.')
-            return
+            if not self.flickr_client:
+                self.flickr_client = flickrapi.FlickrAPI(config['flickr_api_key'], config['flickr_api_secret'], format='xmlnode', timeout=CRAFTED_IMAGE_UPLOAD_TIMEOUT)
 
-        items = ItemDump()
-        for character in characters:
-            character_response = requests.get(self.armory_character_endpoint.format(character), cookies=config['armory_cookies'])
-            dom = BeautifulSoup(character_response.text, 'html.parser')
-            if dom.find(action='login.php'):
-                error, config = await self._armory_login()
-                if error:
-                    await ctx.send('Incorrect armory username/password or armory is not reachable.')
-                    return
-                character_response = requests.get(self.armory_character_endpoint.format(character), cookies=config['armory_cookies'])
-                dom = BeautifulSoup(character_response.text, 'html.parser')
-
-            if 'not allowed' in dom.h1.text:
+            # flickrapi is blocking and token_valid asks the flickr API.
+            if not await asyncio.get_event_loop().run_in_executor(None, functools.partial(self.flickr_client.token_valid, perms='write')):
+                await ctx.send(f'Missing flickr client token. Use `{ctx.prefix}mxl flickr` to configure one.')
+                return
+
+            image_host = FlickrImageHost(self.flickr_client)
+
+        character_pages = []
+        for character, (error, character_items) in zip(characters, await self._fetch_character_pages(characters, config, user_config)):
+            if error == ArmoryError.LOGIN_FAILED:
+                await ctx.send('Incorrect armory username/password or armory is not reachable.')
+                return
+
+            if error == ArmoryError.UNAVAILABLE:
+                await ctx.send(f'Couldn\'t fetch {character}\'s armory page - the armory may be down. Try again later.')
+                return
+
+            if error == ArmoryError.PRIVATE:
                 await ctx.send(f'{character}\'s armory is private - skipping. Please log into the armory and make it publicly viewable to dump its items.')
                 continue
 
-            item_dump = dom.find_all(class_='item-wrapper')
-            self._scrape_items(item_dump, items, character, user_config)
+            character_pages.append((character, character_items))
+
+        async with self._config.member(ctx.author).armory_characters() as dumped_characters:
+            dumped_characters.extend(character for character, _ in character_pages if character not in dumped_characters)
+
+        items = await asyncio.get_event_loop().run_in_executor(None, self._scrape_characters, character_pages)
 
         if not items:
             await ctx.send('No items found.')
             return
 
-        post, cache_update, generation_error = items.to_trade_post(self.flickr_client, self.item_css, user_config, config['flickr_cache'])
-        if cache_update:
-            current_cache = await self._config.flickr_cache()
-            await self._config.flickr_cache.set({**cache_update, **current_cache})
+        images = None
+        if user_config['generate_crafted_images']:
+            self.render_cache.max_bytes = config['render_cache_size'] * 1024 * 1024
+            self.image_links.max_entries = config['flickr_cache_max_entries']
+            self.image_links.max_age = config['flickr_cache_max_age'] * 86400
+            await self._flickr_cache_migration
+            sheet_size = CRAFTED_IMAGE_SHEET_SIZE if user_config['crafted_images_sprite_sheet'] else 0
+            images = ItemImages(image_host, self.item_renderer, self.render_cache, self.image_links, sheet_size)
+            await images.schedule(items.rendered_html())
+
+        sections = items.iter_trade_post(user_config, images)
+        channel = ctx.author.dm_channel or await ctx.author.create_dm()
+        streamed = self._pastebin_limited()
+        try:
+            if streamed:
+                await ctx.send('Pastebin\'s 24h limit was reached recently - sending the trade post to your DMs as it\'s generated.')
+                post, generation_error = None, await self._stream_trade_post(channel, sections)
+            else:
+                post, generation_error = await self._collect_trade_post(sections)
+        finally:
+            if images is not None:
+                images.cancel()
 
         if generation_error == PostGenerationErrors.IMAGE_UPLOAD_FAILED:
-            await ctx.send('An error occurred while uploading an item\'s image to flickr. Try again later.')
+            await ctx.send(f'An error occurred while uploading an item\'s image to {image_host.name}. Try again later.')
             return
         elif generation_error == PostGenerationErrors.UNKNOWN:
             await ctx.send('An unknown error occurred while generating your trade post. Try again later.')
             return
 
+        if streamed:
+            return
+
         pastebin_link = await self._create_pastebin(post, f'MXL trade post for characters: {", ".join(characters)}')
-        channel = ctx.author.dm_channel or await ctx.author.create_dm()
         if pastebin_link:
             await channel.send(f'Dump successful. Here you go: {pastebin_link}')
             return
@@ -456,6 +924,78 @@ class MXL(commands.Cog):
         for page in pagify(post):
             await channel.send(embed=discord.Embed(description=page))
 
+    @mxl.group(name="inventory", aliases=["inv"])
+    async def inventory(self, ctx):
+        """
+        Searches the items of the characters you've dumped.
+
+        Every character dumped with `[p]mxl armory dump` is remembered - the searches use its items as of its last dump.
+        """
+
+        pass
+
+    @inventory.command(name="where")
+    async def inventory_where(self, ctx, *, item: str):
+        """Lists which of your characters hold an item."""
+
+        rows = await self._search_inventory(ctx, item)
+        if rows is None:
+            return
+
+        characters = {}
+        for item_name, character, amount in rows:
+            characters.setdefault(item_name, []).append(f'{character} x{amount:g}' if amount != 1 else character)
+
+        await self._send_inventory(ctx, [f'**{item_name}**: {", ".join(holders)}' for item_name, holders in characters.items()])
+
+    @inventory.command(name="count")
+    async def inventory_count(self, ctx, *, item: str):
+        """Counts how many of an item you own across all of your characters."""
+
+        rows = await self._search_inventory(ctx, item)
+        if rows is None:
+            return
+
+        totals = {}
+        for item_name, character, amount in rows:
+            total, holders = totals.get(item_name, (0, 0))
+            totals[item_name] = (total + amount, holders + 1)
+
+        await self._send_inventory(ctx, [
+            f'**{item_name}**: {total:g} on {holders} character{"s" if holders != 1 else ""}'
+            for item_name, (total, holders) in totals.items()
+        ])
+
+    @inventory.command(name="characters")
+    async def inventory_characters(self, ctx):
+        """Lists the characters in your inventory and when they were last dumped."""
+
+        characters = await self._config.member(ctx.author).armory_characters()
+        if not characters:
+            await ctx.send(f'You haven\'t dumped any characters yet. Use `{ctx.prefix}mxl armory dump` first.')
+            return
+
+        dumped_at = await self.character_snapshots.dumped_at(characters)
+        await self._send_inventory(ctx, [
+            f'**{character}**: dumped {time.strftime("%Y-%m-%d %H:%M", time.gmtime(dumped_at[character]))} UTC' if character in dumped_at else f'**{character}**: no items stored'
+            for character in characters
+        ])
+
+    @inventory.command(name="forget")
+    async def inventory_forget(self, ctx, *characters):
+        """Removes characters from your inventory."""
+
+        async with self._config.member(ctx.author).armory_characters() as dumped_characters:
+            forgotten = [character for character in characters if character in dumped_characters]
+            for character in forgotten:
+                dumped_characters.remove(character)
+
+        if not forgotten:
+            await ctx.send('None of those characters are in your inventory.')
+            return
+
+        await ctx.send(f'Removed {", ".join(forgotten)} from your inventory.')
+
     @mxl.command(name="flickr")
     @checks.is_owner()
     async def flickr(self, ctx, verify_code: str = None):
@@ -471,19 +1011,21 @@ class MXL(commands.Cog):
             return
 
         if not self.flickr_client:
-            self.flickr_client = flickrapi.FlickrAPI(config['flickr_api_key'], config['flickr_api_secret'], format='xmlnode')
+            self.flickr_client = flickrapi.FlickrAPI(config['flickr_api_key'], config['flickr_api_secret'], format='xmlnode', timeout=CRAFTED_IMAGE_UPLOAD_TIMEOUT)
 
-        if self.flickr_client.token_valid(perms='write'):
+        # flickrapi is blocking, all of these ask the flickr API.
+        loop = asyncio.get_event_loop()
+        if await loop.run_in_executor(None, functools.partial(self.flickr_client.token_valid, perms='write')):
             await ctx.send(f'Flickr already authenticated.')
             return
 
         if verify_code:
-            self.flickr_client.get_access_token(verify_code)
+            await loop.run_in_executor(None, self.flickr_client.get_access_token, verify_code)
             await ctx.send('Flickr authenticated successfully.')
             return
 
-        self.flickr_client.get_request_token(oauth_callback='oob')
-        authorize_url = self.flickr_client.auth_url(perms='write')
+        await loop.run_in_executor(None, functools.partial(self.flickr_client.get_request_token, oauth_callback='oob'))
+        authorize_url = await loop.run_in_executor(None, functools.partial(self.flickr_client.auth_url, perms='write'))
         channel = ctx.author.dm_channel or await ctx.author.create_dm()
         await channel.send(f'Click here to authorize flickr: {authorize_url}')
 
@@ -502,33 +1044,66 @@ class MXL(commands.Cog):
         This will not delete the images from the connected flickr account - you have to do that manually.
         """
 
-        await self._config.flickr_cache.set({})
+        await self._flickr_cache_migration
+        await self.image_links.clear(FlickrImageHost.name)
         await ctx.send('Flickr cache cleared successfully.')
 
     @flickr_cache.command(name="list")
-    async def flickr_cache_list(self, ctx):
-        """Lists the currrent flickr cache in a DM."""
+    async def flickr_cache_list(self, ctx, page: int = 1):
+        """Lists a page of the current flickr cache in a DM."""
+
+        page = max(page, 1)
+        await self._flickr_cache_migration
+        links, total = await self.image_links.page(FlickrImageHost.name, page - 1, FLICKR_CACHE_PAGE_SIZE)
+        if not links:
+            await ctx.send(f'The flickr cache has {total} images - no page {page}.' if total else 'The flickr cache is empty.')
+            return
 
-        flickr_cache = await self._config.flickr_cache()
         flickr_cache_msg = f'{"HTML MD5".ljust(32)} Image link\n'
-        for md5, link in flickr_cache.items():
+        for md5, link in links:
             flickr_cache_msg += f'{md5} {link}\n'
 
+        page_count = (total + FLICKR_CACHE_PAGE_SIZE - 1) // FLICKR_CACHE_PAGE_SIZE
         channel = ctx.author.dm_channel or await ctx.author.create_dm()
-        for page in pagify(flickr_cache_msg, page_length=1992):
-            await channel.send(f'```py\n{page}```')
+        for message_page in pagify(flickr_cache_msg, page_length=1992):
+            await channel.send(f'```py\n{message_page}```')
+        await channel.send(f'Page {page}/{page_count} ({total} images).')
+
+    @flickr_cache.command(name="stats")
+    async def flickr_cache_stats(self, ctx):
+        """Shows the flickr cache size and hit rate."""
+
+        await self._flickr_cache_migration
+        total, oldest = await self.image_links.stats(FlickrImageHost.name)
+        config = await self._config.all()
+        oldest_str = time.strftime('%Y-%m-%d', time.gmtime(oldest)) if oldest else '-'
+        max_entries = config['flickr_cache_max_entries'] or 'unlimited'
+        max_age = f'{config["flickr_cache_max_age"]} days' if config['flickr_cache_max_age'] else 'unlimited'
+        await ctx.send(f'Cached images: {total}/{max_entries}\nMax age: {max_age}\nOldest: {oldest_str}\nHits: {self.image_links.hits}\nMisses: {self.image_links.misses}\nHit rate: {self.image_links.hit_rate:.1%}')
+
+    async def _migrate_flickr_cache(self):
+        # Older versions kept the whole cache in a single config value.
+        flickr_cache = await self._config.flickr_cache()
+        if flickr_cache:
+            await self.image_links.put_many(FlickrImageHost.name, flickr_cache)
+            await self._config.flickr_cache.set({})
+            log.info(f'Moved {len(flickr_cache)} flickr cache entries into the image links store.')
 
     async def _forum_login(self):
         config = await self._config.all()
-        session_id = requests.get(self.tradecenter_enpoint).cookies['MedianXL_sid']
-        login_response = requests.post(self.forum_login_endpoint, data={'username': config['forum_username'], 'password': config['forum_password'], 'autologin': 'on', 'login': 'Login', 'sid': session_id})
-        dom = BeautifulSoup(login_response.text, 'html.parser')
+        async with self.session.get(self.tradecenter_enpoint) as session_response:
+            session_id = session_response.cookies['MedianXL_sid'].value
+
+        async with self.session.post(self.forum_login_endpoint, data={'username': config['forum_username'], 'password': config['forum_password'], 'autologin': 'on', 'login': 'Login', 'sid': session_id}) as login_response:
+            dom = BeautifulSoup(await login_response.text(), 'html.parser')
+
         error = dom.find(class_='error')
         if error is None:
+            login_cookies = login_response.history[0].cookies
             config['forum_cookies'] = {
-                'MedianXL_sid': login_response.history[0].cookies['MedianXL_sid'],
-                'MedianXL_k': login_response.history[0].cookies['MedianXL_k'],
-                'MedianXL_u': login_response.history[0].cookies['MedianXL_u']
+                'MedianXL_sid': login_cookies['MedianXL_sid'].value,
+                'MedianXL_k': login_cookies['MedianXL_k'].value,
+                'MedianXL_u': login_cookies['MedianXL_u'].value
             }
             await self._config.set(config)
             return LoginError.NONE, config
@@ -544,166 +1119,419 @@ class MXL(commands.Cog):
 
         return LoginError.UNKNOWN, None
 
-    async def _armory_login(self):
+    async def _walk_transaction_pages(self, item, config, pages, on_page=None):
+        """
+        Fetches up to `pages` forum pages of transactions for `item` and stores them in the local history.
+
+        `on_page` is awaited with the new transactions of every page, in page order, while later pages are still downloading.
+        Returns the login error of the first page and whether anything was found.
+        """
+
+        # The first page goes alone so that a required re-login happens only once.
+        error, transactions = await self._get_transactions(item, config)
+        if error != LoginError.NONE:
+            return error, False
+
+        await self.transaction_history.add_results(item, 0, transactions)
+        if not transactions:
+            await self.transaction_history.mark_searched(item, 1, True)
+            return LoginError.NONE, False
+
+        seen_transactions = set(transactions)
+        if on_page is not None:
+            await on_page(transactions)
+
+        walked_pages = 1
+        exhausted = len(transactions) < PRICECHECK_PAGE_SIZE
+        if pages == 1 or exhausted:
+            await self.transaction_history.mark_searched(item, walked_pages, exhausted)
+            return LoginError.NONE, True
+
         config = await self._config.all()
-        session_id = requests.get(self.armory_index_endpoint).cookies['PHPSESSID']
-        login_response = requests.post(self.armory_login_endpoint, data={'user': config['armory_username'], 'pass': config['armory_password']}, cookies={'PHPSESSID': session_id})
-        dom = BeautifulSoup(login_response.text, 'html.parser')
-        if not dom.contents:
-            config['armory_cookies'] = {
-                'PHPSESSID': session_id
-            }
-            await self._config.set(config)
-            return False, config
+        semaphore = asyncio.Semaphore(PRICECHECK_CONCURRENT_PAGES)
+
+        async def fetch_page(page):
+            async with semaphore:
+                return await self._get_transactions(item, config, page)
+
+        page_tasks = [asyncio.ensure_future(fetch_page(page)) for page in range(1, pages)]
+        try:
+            # Pages are handled in order (and therefore by date) while the later ones keep downloading.
+            for page_task in page_tasks:
+                error, transactions = await page_task
+                if error != LoginError.NONE:
+                    break
+
+                await self.transaction_history.add_results(item, walked_pages, transactions)
+                walked_pages += 1
+                # New transactions shift rows across page boundaries between requests.
+                new_transactions = [transaction for transaction in transactions if transaction not in seen_transactions]
+                seen_transactions.update(new_transactions)
+                if new_transactions and on_page is not None:
+                    await on_page(new_transactions)
+
+                if len(transactions) < PRICECHECK_PAGE_SIZE:
+                    exhausted = True
+                    break
+        finally:
+            for page_task in page_tasks:
+                page_task.cancel()
+
+        await self.transaction_history.mark_searched(item, walked_pages, exhausted)
+        return LoginError.NONE, True
+
+    async def _get_transactions(self, item, config, page=0):
+        cache_key = (' '.join(item.lower().split()), page)
+        transactions = self.pricecheck_cache.get(cache_key)
+        if transactions is not None:
+            return LoginError.NONE, transactions
+
+        error, transactions = await self._fetch_transactions(item, config, page)
+        if error == LoginError.NONE:
+            ttl = config['pricecheck_cache_ttl'] if transactions else config['pricecheck_negative_cache_ttl']
+            self.pricecheck_cache.set(cache_key, transactions, ttl)
+            await self.transaction_history.add(transactions)
+
+        return error, transactions
+
+    async def _send_transactions(self, ctx, item, transactions):
+        def escape_underscore(text):
+            return text.replace('_', '\\_')
 
-        return True, None
+        message = ''
+        for transaction in transactions:
+            message += f'--------------------------\n**Transaction note**: {escape_underscore(transaction.note)}\n**From**: {escape_underscore(transaction.sender)}\n**To**: {escape_underscore(transaction.receiver)}\n**TG**: {transaction.tg}\n**Date**: {transaction.date}\n'
 
-    def _scrape_items(self, item_dump, items, character, user_config):
-        for item in item_dump:
-            item_name = ''
-            set_match = None
-            if item.font:
-                if item.font.br:
-                    item.font.br.extract()
+        for page in pagify(message, delims=['--------------------------']):
+            embed = discord.Embed(title=f'Auctions for {item}', description=page)
+            await ctx.send(embed=embed)
 
-                item_name = item.font.text
-                set_match = re.search('\[([^\]]+)', item.font.text)
-            else:
-                if item.span.br:
-                    item.span.br.extract()
+    async def _fetch_transactions(self, item, config, page=0):
+        def not_logged_in_function(tag):
+            return 'We\'re sorry' in tag.text
 
-                item_name = item.span.text
-                set_match = re.search('\[([^\]]+)', item.span.text)
+        # The results are paginated phpBB style, with an offset in `start`.
+        params = {'start': page * PRICECHECK_PAGE_SIZE} if page else None
+        async with self.session.post(self.tradecenter_enpoint, params=params, data={'search': item, 'submit': ''}, cookies=config['forum_cookies']) as pricecheck_response:
+            dom = BeautifulSoup(await pricecheck_response.text(), 'html.parser')
 
-            if item_name in IGNORED_ITEMS:
-                continue
+        if dom.find(not_logged_in_function):
+            error, config = await self._forum_login()
+            if error != LoginError.NONE:
+                return error, None
 
-            if set_match:
-                set_name = set_match.group(1)
-                item_name = item_name.split('[')[0].strip()
-                items.increment_set_item(set_name, item_name, character, item.parent.parent)
-                continue
+            async with self.session.post(self.tradecenter_enpoint, params=params, data={'search': item, 'submit': ''}, cookies=config['forum_cookies']) as pricecheck_response:
+                dom = BeautifulSoup(await pricecheck_response.text(), 'html.parser')
 
-            if item.span['class'][0] == 'color-green' and item_name in SETS.keys():
-                set_name = SETS[item_name]
-                items.increment_set_item(set_name, item_name, character, item.parent.parent)
-                continue
+            if dom.find(not_logged_in_function):
+                return LoginError.STILL_LOGGED_OUT, None
 
-            if item_name in SU_ITEMS:
-                items.increment_su(item_name, character, item.parent.parent)
-                continue
+        return LoginError.NONE, self._parse_transactions(dom)
 
-            if 'Hanfod' in item_name:
-                items.increment_su('Hanfod Tân', character, item.parent.parent)
-                continue
+    def _parse_transactions(self, dom):
+        def no_transactions_found(tag):
+            return 'No transactions found.' in tag.text
 
-            if item_name == 'Jewel':
-                items.increment_other('Jewel', character, item.parent.parent)
-                continue
+        if dom.tbody.find(no_transactions_found):
+            return []
 
-            if item_name in SSU_ITEMS:
-                items.increment_ssu(item_name, character, item.parent.parent)
+        transactions = []
+        for result in dom.tbody.contents:
+            if result == '\n':
                 continue
 
-            if item_name in SSSU_ITEMS:
-                items.increment_sssu(item_name, character, item.parent.parent)
-                continue
+            columns = [column for column in result.contents if column != '\n']
+            transactions.append(Transaction(
+                sender=columns[0].a.text,
+                receiver=columns[2].a.text,
+                tg=columns[1].div.text,
+                note=columns[3].text,
+                date=columns[4].text
+            ))
+
+        return transactions
+
+    async def _send_login_error(self, ctx, error):
+        if error == LoginError.INCORRECT_USERNAME:
+            await ctx.send(f'Incorrect forum username. Please set a valid one using `{ctx.prefix}mxl config username`.')
+        elif error == LoginError.INCORRECT_PASSWORD:
+            await ctx.send(f'Incorrect forum password. Please set the proper one using `{ctx.prefix}mxl config password`.')
+        elif error == LoginError.LOGIN_ATTEMPTS_EXCEEDED:
+            await ctx.send(f'Maximum login attempts exceeded. Please login to the forum manually (with the configured account) and solve the CAPTCHA.')
+        elif error == LoginError.STILL_LOGGED_OUT:
+            await ctx.send('Couldn\'t login to the forums. Please report this to the plugin author.')
+        else:
+            await ctx.send('Unknown error during login.')
 
-            if item_name in RUNEWORDS:
-                items.increment_rw(item_name, character, item.parent.parent)
-                continue
+    async def _armory_login(self):
+        config = await self._config.all()
+        async with self.session.get(self.armory_index_endpoint) as session_response:
+            session_id = session_response.cookies['PHPSESSID'].value
 
-            if item_name in AMULETS:
-                items.increment_amulet(item_name, character, item.parent.parent)
-                continue
+        async with self.session.post(self.armory_login_endpoint, data={'user': config['armory_username'], 'pass': config['armory_password']}, cookies={'PHPSESSID': session_id}) as login_response:
+            dom = BeautifulSoup(await login_response.text(), 'html.parser')
 
-            if item_name in RINGS:
-                items.increment_ring(item_name, character, item.parent.parent)
-                continue
+        if not dom.contents:
+            config['armory_cookies'] = {
+                'PHPSESSID': session_id
+            }
+            await self._config.set(config)
+            return False, config
 
-            if item_name in JEWELS:
-                items.increment_jewel(item_name, character, item.parent.parent)
-                continue
+        return True, None
 
-            if item_name in QUIVERS:
-                items.increment_quiver(item_name, character, item.parent.parent)
-                continue
+    async def _fetch_character_pages(self, characters, config, user_config):
+        """
+        Fetches the characters' armory pages concurrently and classifies their items.
 
-            if item_name in MOS:
-                items.increment_mo(item_name, character, item.parent.parent)
-                continue
+        Returns an (ArmoryError, items) pair for every character, in the same order as `characters`. The items are
+        (bucket, item name, amount, group, html) tuples, taken from the character's snapshot when the page hasn't changed.
+        """
 
-            if (item.span['class'][0] == 'color-white' or item.span['class'][0] == 'color-blue') and item_name not in WHITE_IGNORED_ITEMS:
-                base_name = item_name + ' [eth]' if 'Ethereal' in item.text else ''.join(item_name.split('Superior '))
-                items.increment_rw_base(base_name, character, item.parent.parent)
-                continue
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(ARMORY_CONCURRENT_FETCHES)
+        login_lock = asyncio.Lock()
+        cookies = config['armory_cookies']
+        login_failed = False
+        wants_html = None
+        if user_config['generate_crafted_images'] and not user_config['crafted_as_base']:
+            wants_html = lambda color: color in RENDERED_COLORS
+
+        variant = snapshot_variant(user_config['crafted_as_base'], wants_html is not None)
+
+        async def fetch_character(character):
+            nonlocal cookies, login_failed
+            async with semaphore:
+                snapshot = await self.character_snapshots.get(character, variant)
+                used_cookies = cookies
+                page = await self._fetch_character_page(character, used_cookies, wants_html, snapshot)
+                if page.login_form:
+                    async with login_lock:
+                        # Only the first fetch that runs into the login form logs in, the others reuse its session.
+                        if cookies is used_cookies and not login_failed:
+                            error, new_config = await self._armory_login()
+                            login_failed = error
+                            if not error:
+                                cookies = new_config['armory_cookies']
+
+                    if login_failed:
+                        return ArmoryError.LOGIN_FAILED, None
+
+                    page = await self._fetch_character_page(character, cookies, wants_html, snapshot)
+
+                if page.failed:
+                    # An error page has no items - it must never replace the character's snapshot and inventory.
+                    log.warning(f'Fetching {character}\'s armory page failed with status {page.status}.')
+                    return ArmoryError.UNAVAILABLE, None
+
+                if page.unchanged:
+                    if page.fingerprint is not None:
+                        # Same page, but the armory may have started sending (other) validators - remember them for the next dump.
+                        snapshot.etag, snapshot.last_modified = page.etag, page.last_modified
+                    snapshot.fetched_at = time.time()
+                    await self.character_snapshots.refresh(snapshot)
+                    return ArmoryError.NONE, snapshot.items
+
+                if page.private:
+                    return ArmoryError.PRIVATE, None
+
+                items = await loop.run_in_executor(None, self._classify_items, page.items, user_config)
+                await self.character_snapshots.put(CharacterSnapshot(character, variant, page.fingerprint, page.etag, page.last_modified, items, time.time()))
+                return ArmoryError.NONE, items
+
+        return await asyncio.gather(*(fetch_character(character) for character in characters))
+
+    async def _fetch_character_page(self, character, cookies, wants_html, snapshot=None):
+        """
+        Downloads a character's page and parses it, off the event loop, unless it's unchanged since `snapshot`.
 
-            if item.span['class'][0] == 'color-yellow':
-                items.increment_shrine_base(item_name, character, item.parent.parent)
-                continue
+        The snapshot's validators are sent along, so the armory can answer with a bodyless 304 if it supports them.
+        Otherwise the page is considered unchanged when its fingerprint matches the snapshot's.
+        """
 
-            if item_name in CHARMS:
-                items.increment_charm(item_name, character, item.parent.parent)
-                continue
+        headers = {}
+        if snapshot is not None:
+            if snapshot.etag:
+                headers['If-None-Match'] = snapshot.etag
+            if snapshot.last_modified:
+                headers['If-Modified-Since'] = snapshot.last_modified
+
+        fingerprint = hashlib.sha256()
+        chunks = []
+        async with self.session.get(self.armory_character_endpoint.format(character), cookies=cookies, headers=headers) as character_response:
+            page = ArmoryPage(character_response.status, etag=character_response.headers.get('ETag'), last_modified=character_response.headers.get('Last-Modified'))
+            if character_response.status == 304 and snapshot is not None:
+                page.unchanged = True
+                return page
+
+            if page.failed:
+                return page
+
+            decoder = codecs.getincrementaldecoder(character_response.charset or 'utf-8')(errors='replace')
+            async for chunk in character_response.content.iter_chunked(ARMORY_CHUNK_SIZE):
+                fingerprint.update(chunk)
+                chunks.append(decoder.decode(chunk))
+
+        chunks.append(decoder.decode(b'', final=True))
+        page.fingerprint = fingerprint.hexdigest()
+        if snapshot is not None and page.fingerprint == snapshot.fingerprint:
+            page.unchanged = True
+            return page
+
+        parser, page.items = await asyncio.get_event_loop().run_in_executor(None, parse_armory_page, chunks, wants_html)
+        page.login_form = parser.login_form
+        page.heading = parser.heading
+        return page
+
+    def _scrape_characters(self, character_pages):
+        items = ItemDump()
+        for character, character_items in character_pages:
+            for bucket, item_name, amount, group, html in character_items:
+                items.add(bucket, item_name, character, html, amount, group)
 
-            shrine_match = re.search('Shrine \(([^\)]+)', item_name)
-            if shrine_match:
-                shrine_name = item_name.split('(')[0].strip()
-                amount = int(shrine_match.group(1)) / 10
-                items.increment_shrine(shrine_name, character, item.parent.parent, amount)
-                continue
+        return items
 
-            if item_name in SHRINE_VESSELS:
-                vessel_amount = int((re.search('Quantity: ([0-9]+)', item.find(class_='color-grey').text)).group(1))
-                shrine_name = VESSEL_TO_SHRINE[item_name]
-                items.increment_shrine(shrine_name, character, item.parent.parent, vessel_amount)
+    def _classify_items(self, character_items, user_config):
+        classified = []
+        for features in character_items:
+            classification = ITEM_RULES.classify(features, user_config)
+            if classification is None:
                 continue
 
-            if item_name == 'Arcane Cluster':
-                crystals_amount = int((re.search('Quantity: ([0-9]+)', item.find(class_='color-grey').text)).group(1))
-                items.increment_other('Arcane Crystal', character, item.parent.parent, crystals_amount)
-                continue
+            bucket, item_name, amount, group = classification
+            classified.append((bucket, item_name, amount, group, features.html if bucket in RENDERED_BUCKETS else None))
 
-            AC_shards_match = re.search('Shards \(([^\)]+)', item_name)
-            if AC_shards_match:
-                amount = int(AC_shards_match.group(1)) / 5
-                items.increment_other('Arcane Crystal', character, item.parent.parent, amount)
-                continue
+        return classified
 
-            if item.span['class'][0] == 'color-orange' and item_name not in ORANGE_IGNORED_ITEMS and item_name not in TROPHIES:
-                if user_config['crafted_as_base']:
-                    items.increment_shrine_base(item_name, character, item.parent.parent)
-                    continue
+    async def _search_inventory(self, ctx, item):
+        """Returns the (item name, character, amount) rows matching `item` or None if there's nothing to show."""
 
-                items.increment_crafted(item_name, character, item.parent.parent)
-                continue
+        characters = await self._config.member(ctx.author).armory_characters()
+        if not characters:
+            await ctx.send(f'You haven\'t dumped any characters yet. Use `{ctx.prefix}mxl armory dump` first.')
+            return None
 
-            if item_name in TROPHIES:
-                items.increment_trophy(item_name, character, item.parent.parent)
-                continue
+        rows = await self.character_snapshots.where(characters, item)
+        if not rows:
+            await ctx.send(f'None of your {len(characters)} characters hold anything matching `{item}`.')
+            return None
+
+        return rows
 
-            items.increment_other(item_name, character, item.parent.parent)
+    async def _send_inventory(self, ctx, lines):
+        for page in pagify('\n'.join(lines)):
+            await ctx.send(page)
 
     async def _create_pastebin(self, text, title=None):
         api_key = await self._config.pastebin_api_key()
         pb = PasteBin(api_key)
-        pb_link = pb.paste(text, name=title, private='1', expire='1D')
+        # PasteBin uses urllib under the hood, keep it off the event loop.
+        pb_link = await asyncio.get_event_loop().run_in_executor(None, functools.partial(pb.paste, text, name=title, private='1', expire='1D'))
+        if 'Post limit' in pb_link:
+            self._pastebin_limited_at = time.monotonic()
+
         return None if 'Bad API request' in pb_link or 'Post limit' in pb_link else pb_link
 
-    def _get_auction_embeds(self, raw_auctions):
+    def _pastebin_limited(self):
+        return self._pastebin_limited_at is not None and time.monotonic() - self._pastebin_limited_at < PASTEBIN_LIMIT_COOLDOWN
+
+    async def _collect_trade_post(self, sections):
+        """Generates the whole trade post off the event loop. Returns a (post, PostGenerationErrors) pair."""
+
+        parts = []
+        while True:
+            section, done, error = await asyncio.get_event_loop().run_in_executor(self._trade_post_executor, _next_section, sections)
+            if done:
+                return (None if error else ''.join(parts)), error
+
+            parts.append(section)
+
+    async def _stream_trade_post(self, channel, sections):
+        """
+        Sends the trade post to `channel` in embeds while it's being generated - every page is sent as soon as it's full.
+
+        Returns the PostGenerationErrors value that stopped the generation, if any.
+        """
+
+        pending = ''
+        while True:
+            section, done, error = await asyncio.get_event_loop().run_in_executor(self._trade_post_executor, _next_section, sections)
+            if done:
+                break
+
+            pending += section
+            pages = list(pagify(pending))
+            # The last page may still grow, only the ones before it are final.
+            for page in pages[:-1]:
+                await channel.send(embed=discord.Embed(description=page))
+
+            pending = pages[-1] if pages else ''
+
+        if pending.strip():
+            await channel.send(embed=discord.Embed(description=pending))
+
+        return error
+
+    async def _crawl_transactions(self):
+        await self.bot.wait_until_ready()
+        while True:
+            config = await self._config.all()
+            if config['forum_username']:
+                for item in config['history_crawl_items']:
+                    try:
+                        error, _ = await self._walk_transaction_pages(item, config, HISTORY_CRAWL_PAGES)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:
+                        log.exception(f'Crawling transactions for {item} failed.')
+                        continue
+
+                    if error != LoginError.NONE:
+                        log.warning(f'Transaction crawler couldn\'t log into the forum: {error}')
+                        break
+
+                    config = await self._config.all()
+
+            await asyncio.sleep(config['history_crawl_interval'])
+
+    async def _poll_auctions(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await self._check_auction_updates()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('Auction update check failed.')
+
+            await asyncio.sleep(await self._config.auctions_poll_interval())
+
+    async def _check_auction_updates(self):
+        channels = [self.bot.get_channel(channel_id) for channel_id, channel_config in (await self._config.all_channels()).items() if channel_config['auction_notifications']]
+        channels = [channel for channel in channels if channel is not None]
+        if not channels:
+            # Nobody's listening - don't poll, and start from a fresh baseline once someone subscribes.
+            self.auction_differ.reset()
+            return
+
+        auctions = await self.auction_feed.get(await self._config.auctions_ttl())
+        if auctions is None:
+            return
+
+        changes = self.auction_differ.diff(auctions)
+        if not changes:
+            return
+
         embeds = []
-        for auction in raw_auctions:
-            soup = BeautifulSoup(auction, 'html.parser')
-            current_bid = soup.find(class_='coins').text
-            number_of_bids = soup.div.div.find(title='Bids').next_sibling.strip()
-            title = soup.h4.text
-            time_left = soup.span.text.strip()
-            started_by = soup.find(class_='username').text
-            description = f'Started by: {started_by}\nCurrent bids: {number_of_bids}\nCurrent bid: {current_bid} TG\nTime left: {time_left}'
-            image = soup.find(title='Image')
-            embed = discord.Embed(title=title, description=description)
-            if image is not None:
-                embed.set_image(url=image['data-featherlight'])
-            embeds.append(embed)
-
-        return embeds
+        for label, changed_auctions in (('New auction', changes.new), ('New bid', changes.new_bids), ('Ending soon', changes.ending_soon)):
+            for auction in changed_auctions:
+                embed = auction.to_embed()
+                embed.set_author(name=label)
+                embeds.append(embed)
+
+        for channel in channels:
+            for embed in embeds:
+                try:
+                    await channel.send(embed=embed)
+                except discord.HTTPException:
+                    break
\ No newline at end of file
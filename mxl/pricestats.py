@@ -0,0 +1,120 @@
+import dataclasses
+import re
+import statistics
+import time
+from typing import List, Optional, Tuple
+from .history import parse_transaction_date
+
+TG_REGEX = re.compile(r'[^0-9]')
+QUANTITY_REGEXES = [
+    re.compile(r'\b(\d+)\s*x\b', re.IGNORECASE),
+    re.compile(r'\bx\s*(\d+)\b', re.IGNORECASE),
+    re.compile(r'^\s*(\d+)\s+[^\d\s]')
+]
+ROLLING_WINDOW = 7 * 86400
+ROLLING_WINDOWS = 4
+
+@dataclasses.dataclass
+class PriceSummary:
+    transactions: int
+    priced: int
+    median: float
+    q1: float
+    q3: float
+    low: float
+    high: float
+    mean: float
+    rolling: List[Tuple[int, Optional[float]]]
+
+    @property
+    def iqr(self):
+        return self.q3 - self.q1
+
+def parse_tg(tg):
+    digits = TG_REGEX.sub('', tg)
+    return int(digits) if digits else None
+
+def parse_quantity(note):
+    """Quantity traded according to the note ('2x Ring', 'Ring x2', '10 Shrines'). Defaults to 1."""
+
+    for quantity_regex in QUANTITY_REGEXES:
+        match = quantity_regex.search(note)
+        if match and int(match.group(1)) > 0:
+            return int(match.group(1))
+
+    return 1
+
+def unit_prices(transactions):
+    """Returns (timestamp, price per item) for every transaction that has a readable TG amount."""
+
+    prices = []
+    for transaction in transactions:
+        tg = parse_tg(transaction.tg)
+        if not tg:
+            continue
+
+        prices.append((parse_transaction_date(transaction.date), tg / parse_quantity(transaction.note)))
+
+    return prices
+
+def quartiles(values):
+    """
+    Returns the (Q1, median, Q3) of the sorted `values`, interpolated like statistics.quantiles(method='inclusive').
+
+    statistics.quantiles only exists since Python 3.8.
+    """
+
+    if len(values) == 1:
+        return values[0], values[0], values[0]
+
+    last = len(values) - 1
+    result = []
+    for quarter in range(1, 4):
+        index, remainder = divmod(quarter * last, 4)
+        result.append((values[index] * (4 - remainder) + values[index + 1] * remainder) / 4 if remainder else values[index])
+
+    return tuple(result)
+
+def summarize(transactions, now=None):
+    """
+    Computes median/IQR based statistics over the per-item prices of the transactions.
+
+    The mean and the rolling averages only use prices within 1.5 IQR of the quartiles, so a single
+    mistyped note doesn't drag them around. Returns None if no transaction has a usable price.
+    """
+
+    prices = unit_prices(transactions)
+    if not prices:
+        return None
+
+    values = sorted(price for _, price in prices)
+    q1, median, q3 = quartiles(values)
+
+    low_fence = q1 - 1.5 * (q3 - q1)
+    high_fence = q3 + 1.5 * (q3 - q1)
+    typical = [(timestamp, price) for timestamp, price in prices if low_fence <= price <= high_fence]
+
+    now = now or time.time()
+    window_sums = [0.0] * ROLLING_WINDOWS
+    window_counts = [0] * ROLLING_WINDOWS
+    for timestamp, price in typical:
+        if timestamp is None:
+            continue
+
+        window = int((now - timestamp) // ROLLING_WINDOW)
+        if 0 <= window < ROLLING_WINDOWS:
+            window_sums[window] += price
+            window_counts[window] += 1
+
+    rolling = [(window, window_sums[window] / window_counts[window] if window_counts[window] else None) for window in range(ROLLING_WINDOWS)]
+    return PriceSummary(
+        transactions=len(transactions),
+        priced=len(values),
+        median=median,
+        q1=q1,
+        q3=q3,
+        low=values[0],
+        high=values[-1],
+        mean=statistics.mean(price for _, price in typical),
+        rolling=rolling
+    )
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import pathlib
+import imgkit
+from .constants import CRAFTED_IMAGE_RENDER_WORKERS
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:
+    async_playwright = None
+
+log = logging.getLogger('red.baiumbg.mxl')
+
+class ItemRenderer:
+    """
+    Long-lived renderer of item tooltips to PNG bytes, styled with the bundled item CSS.
+
+    If playwright and its chromium are installed, a headless chromium is started on first use and kept running: each of
+    its `workers` pages parses the CSS once and then renders whole batches of tooltips, one element screenshot per tooltip.
+    Otherwise every tooltip is piped through wkhtmltoimage (imgkit) on `executor`, with the CSS inlined and the PNG read
+    from its stdout - still a process per tooltip, but no temporary files.
+    """
+
+    def __init__(self, css_file, executor, workers=CRAFTED_IMAGE_RENDER_WORKERS):
+        self._css = pathlib.Path(css_file).read_text(encoding='utf-8')
+        self._executor = executor
+        self._workers = workers
+        self._playwright = None
+        self._browser = None
+        self._pages = None
+        self._started = False
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def backend(self):
+        return 'chromium' if self._browser is not None else 'wkhtmltoimage'
+
+    async def render(self, htmls):
+        """Renders a batch of tooltips, returns their PNG bytes in the same order."""
+
+        await self._start()
+        if self._browser is None:
+            loop = asyncio.get_event_loop()
+            return await asyncio.gather(*(loop.run_in_executor(self._executor, self._render_wkhtmltoimage, html) for html in htmls))
+
+        page = await self._pages.get()
+        try:
+            return await self._render_page(page, list(htmls))
+        finally:
+            self._pages.put_nowait(page)
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _start(self):
+        async with self._start_lock:
+            if self._started:
+                return
+
+            self._started = True
+            if async_playwright is None:
+                log.info('playwright isn\'t installed, crafted item images are rendered with wkhtmltoimage.')
+                return
+
+            try:
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch()
+                self._pages = asyncio.Queue()
+                for _ in range(self._workers):
+                    page = await self._browser.new_page()
+                    await page.set_content(f'<html><head><style>{self._css}</style></head><body></body></html>')
+                    self._pages.put_nowait(page)
+            except Exception:
+                # Most likely the browser was never downloaded - the playwright package doesn't do that by itself.
+                log.exception('Starting chromium failed (run `python -m playwright install chromium`), crafted item images are rendered with wkhtmltoimage.')
+                await self.close()
+
+    async def _render_page(self, page, htmls):
+        # Every tooltip gets its own shrink-to-fit box, like the zero width page wkhtmltoimage renders.
+        await page.evaluate('''htmls => {
+            document.body.innerHTML = '';
+            for (const html of htmls) {
+                const box = document.createElement('div');
+                box.className = 'item-render';
+                box.style.display = 'table';
+                box.innerHTML = html;
+                document.body.appendChild(box);
+            }
+        }''', htmls)
+        await page.wait_for_function('Array.from(document.images).every(image => image.complete)')
+        boxes = await page.query_selector_all('body > .item-render')
+        return [await box.screenshot(type='png') for box in boxes]
+
+    def _render_wkhtmltoimage(self, html):
+        # Without an output path imgkit returns what wkhtmltoimage writes to its stdout.
+        return imgkit.from_string(f'<style>{self._css}</style>{html}', False, options={'width': '0', 'format': 'png'})
@@ -0,0 +1,138 @@
+import json
+from .history import normalize_search
+from .storage import SQLiteStore
+
+# Bump whenever the classification rules change, so snapshots classified by the old rules aren't reused.
+SNAPSHOT_VERSION = 1
+
+def snapshot_variant(crafted_as_base, keeps_html):
+    """Snapshots depend on the options the page was classified with, each combination is stored separately."""
+
+    return f'{SNAPSHOT_VERSION}:{int(crafted_as_base)}:{int(keeps_html)}'
+
+class CharacterSnapshot:
+    """
+    The classified items of one character page.
+
+    `items` holds the (bucket, item name, amount, group, html) classifications in page order, `fingerprint` the page's
+    hash and `etag`/`last_modified` the validators the armory sent with it, if any.
+    """
+
+    __slots__ = ('character', 'variant', 'fingerprint', 'etag', 'last_modified', 'items', 'fetched_at')
+
+    def __init__(self, character, variant, fingerprint, etag, last_modified, items, fetched_at):
+        self.character = character
+        self.variant = variant
+        self.fingerprint = fingerprint
+        self.etag = etag
+        self.last_modified = last_modified
+        self.items = items
+        self.fetched_at = fetched_at
+
+class CharacterSnapshots(SQLiteStore):
+    """
+    Last classified armory page of every dumped character.
+
+    The items of each character's latest snapshot are also kept in `inventory`, keyed by the normalized item name first -
+    an inverted index from item name to the characters holding it, which the inventory lookups read.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS snapshots (
+            character TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            items TEXT NOT NULL,
+            fetched_at INTEGER NOT NULL,
+            PRIMARY KEY (character, variant)
+        );
+        CREATE TABLE IF NOT EXISTS inventory (
+            search_name TEXT NOT NULL,
+            character TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            name TEXT NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (search_name, character, bucket, name)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS inventory_character ON inventory (character);
+    '''
+
+    async def get(self, character, variant):
+        return await self.run(self._get, character, variant)
+
+    async def put(self, snapshot):
+        await self.run(self._put, snapshot)
+
+    async def refresh(self, snapshot):
+        """Stores a reused snapshot's validators and fetch time, its items are unchanged."""
+
+        await self.run(lambda connection: connection.execute(
+            'UPDATE snapshots SET etag = ?, last_modified = ?, fetched_at = ? WHERE character = ? AND variant = ?',
+            (snapshot.etag, snapshot.last_modified, int(snapshot.fetched_at), snapshot.character, snapshot.variant)
+        ))
+
+    async def where(self, characters, search):
+        """Returns the (item name, character, amount) rows of the `characters`' items matching `search`."""
+
+        return await self.run(self._where, list(characters), normalize_search(search))
+
+    async def dumped_at(self, characters):
+        """Returns {character: last dump timestamp} of the `characters` that have a snapshot."""
+
+        return await self.run(lambda connection: dict(connection.execute(
+            f'SELECT character, MAX(fetched_at) FROM snapshots WHERE character IN ({_placeholders(characters)}) GROUP BY character',
+            list(characters)
+        )))
+
+    async def stats(self):
+        return await self.run(lambda connection: connection.execute('SELECT COUNT(*), COUNT(DISTINCT character) FROM snapshots').fetchone())
+
+    async def clear(self):
+        await self.run(lambda connection: connection.executescript('DELETE FROM snapshots; DELETE FROM inventory;'))
+
+    def _get(self, connection, character, variant):
+        row = connection.execute(
+            'SELECT character, variant, fingerprint, etag, last_modified, items, fetched_at FROM snapshots WHERE character = ? AND variant = ?',
+            (character, variant)
+        ).fetchone()
+        if row is None:
+            return None
+
+        *fields, items, fetched_at = row
+        return CharacterSnapshot(*fields, [tuple(item) for item in json.loads(items)], fetched_at)
+
+    def _put(self, connection, snapshot):
+        connection.execute(
+            'INSERT OR REPLACE INTO snapshots (character, variant, fingerprint, etag, last_modified, items, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (snapshot.character, snapshot.variant, snapshot.fingerprint, snapshot.etag, snapshot.last_modified,
+             json.dumps(snapshot.items, ensure_ascii=False), int(snapshot.fetched_at))
+        )
+
+        amounts = {}
+        for bucket, item_name, amount, _, _ in snapshot.items:
+            amounts[bucket, item_name] = amounts.get((bucket, item_name), 0) + amount
+
+        connection.execute('DELETE FROM inventory WHERE character = ?', (snapshot.character,))
+        connection.executemany(
+            'INSERT INTO inventory (search_name, character, bucket, name, amount) VALUES (?, ?, ?, ?, ?)',
+            [(normalize_search(item_name), snapshot.character, bucket, item_name, amount) for (bucket, item_name), amount in amounts.items()]
+        )
+
+    def _where(self, connection, characters, search):
+        if not characters:
+            return []
+
+        query = f'SELECT name, character, SUM(amount) FROM inventory WHERE character IN ({_placeholders(characters)}) AND '
+        group = ' GROUP BY name, character ORDER BY name, SUM(amount) DESC, character'
+        rows = connection.execute(query + 'search_name = ?' + group, characters + [search]).fetchall()
+        if rows:
+            return rows
+
+        # No exact name match, fall back to a substring search over the characters' items.
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return connection.execute(query + "search_name LIKE ? ESCAPE '\\'" + group, characters + [f'%{escaped}%']).fetchall()
+
+def _placeholders(values):
+    return ', '.join('?' * len(values))
@@ -0,0 +1,41 @@
+import asyncio
+import concurrent.futures
+import functools
+import sqlite3
+
+class SQLiteStore:
+    """
+    Base class for the cog's local sqlite databases.
+
+    Every query runs on a single worker thread that owns the connection, so the event loop never waits on disk I/O
+    and sqlite never sees the connection from another thread.
+    """
+
+    SCHEMA = ''
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def run(self, function, *args):
+        """Runs `function(connection, *args)` inside a transaction on the store's thread."""
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, functools.partial(self._call, function, *args))
+
+    def close(self):
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+    def _call(self, function, *args):
+        if self._connection is None:
+            self._connection = sqlite3.connect(str(self.path))
+            self._connection.executescript(self.SCHEMA)
+
+        with self._connection:
+            return function(self._connection, *args)
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,45 @@
+"""
+Benchmarks the auction fragment extractor against the old BeautifulSoup implementation.
+
+Usage: python -m mxl.utils.bench_auctions <captured api.php?mode=tradecenter response (JSON)> [rounds]
+
+utils/fixtures/tradecenter.json is a sanitized response covering auctions with and without images and bids:
+    python -m mxl.utils.bench_auctions mxl/utils/fixtures/tradecenter.json
+"""
+
+import json
+import sys
+import timeit
+from bs4 import BeautifulSoup
+from mxl.auctions import parse_auction
+from mxl.dclasses import Auction
+
+def parse_auction_bs4(auction):
+    soup = BeautifulSoup(auction, 'html.parser')
+    image = soup.find(title='Image')
+    return Auction(
+        title=soup.h4.text,
+        seller=soup.find(class_='username').text,
+        current_bid=soup.find(class_='coins').text,
+        bids=soup.div.div.find(title='Bids').next_sibling.strip(),
+        time_left=soup.span.text.strip(),
+        image=image['data-featherlight'] if image is not None else None
+    )
+
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding='utf-8') as fixture:
+        raw_auctions = json.load(fixture)['auctions']
+
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    expected = [parse_auction_bs4(auction) for auction in raw_auctions]
+    actual = [parse_auction(auction) for auction in raw_auctions]
+    for old, new in zip(expected, actual):
+        if old != new:
+            print(f'Mismatch:\n  bs4:       {old}\n  extractor: {new}')
+            sys.exit(1)
+
+    bs4_time = timeit.timeit(lambda: [parse_auction_bs4(auction) for auction in raw_auctions], number=rounds)
+    extractor_time = timeit.timeit(lambda: [parse_auction(auction) for auction in raw_auctions], number=rounds)
+    print(f'{len(raw_auctions)} auctions, {rounds} rounds')
+    print(f'bs4:       {bs4_time / rounds * 1000:.2f} ms/snapshot')
+    print(f'extractor: {extractor_time / rounds * 1000:.2f} ms/snapshot ({bs4_time / extractor_time:.1f}x)')
@@ -0,0 +1,161 @@
+"""
+Golden check and benchmark for the armory item classification rules.
+
+Parses and classifies every item of the saved armory pages (char.php responses) with the streaming parser plus the
+rule table and with BeautifulSoup plus the old `if ... in LIST` cascade, fails on any difference (classification or
+crafted item HTML) and prints the timings of both.
+With --golden, the classifications are also compared against (or, if the file doesn't exist yet, saved to) a JSON file.
+
+Usage: python -m mxl.utils.bench_classifier [--golden golden.json] [--crafted-as-base] [--rounds N] page.html [page.html ...]
+
+utils/fixtures holds a sanitized armory page with a few items of every category and its golden classifications:
+    python -m mxl.utils.bench_classifier --golden mxl/utils/fixtures/char_golden.json mxl/utils/fixtures/char.html
+    python -m mxl.utils.bench_classifier --crafted-as-base --golden mxl/utils/fixtures/char_golden_crafted_as_base.json mxl/utils/fixtures/char.html
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from bs4 import BeautifulSoup
+from mxl.armory import parse_armory_page
+from mxl.classifier import ITEM_RULES
+from mxl.constants import SU_ITEMS, SSU_ITEMS, SSSU_ITEMS, SETS, AMULETS, RINGS, JEWELS, MOS, RUNEWORDS, IGNORED_ITEMS, \
+                          SHRINE_VESSELS, WHITE_IGNORED_ITEMS, VESSEL_TO_SHRINE, QUIVERS, CHARMS, TROPHIES, ORANGE_IGNORED_ITEMS
+
+def classify_cascade(item, user_config):
+    if item.font:
+        if item.font.br:
+            item.font.br.extract()
+
+        item_name = item.font.text
+    else:
+        if item.span.br:
+            item.span.br.extract()
+
+        item_name = item.span.text
+
+    set_match = re.search(r'\[([^\]]+)', item_name)
+    if item_name in IGNORED_ITEMS:
+        return None
+    if set_match:
+        return 'sets', item_name.split('[')[0].strip(), 1, set_match.group(1)
+    if item.span['class'][0] == 'color-green' and item_name in SETS.keys():
+        return 'sets', item_name, 1, SETS[item_name]
+    if item_name in SU_ITEMS:
+        return 'su', item_name, 1, None
+    if 'Hanfod' in item_name:
+        return 'su', 'Hanfod Tân', 1, None
+    if item_name == 'Jewel':
+        return 'other', 'Jewel', 1, None
+    for bucket, names in (('ssu', SSU_ITEMS), ('sssu', SSSU_ITEMS), ('runewords', RUNEWORDS), ('amulets', AMULETS),
+                          ('rings', RINGS), ('jewels', JEWELS), ('quivers', QUIVERS), ('mos', MOS)):
+        if item_name in names:
+            return bucket, item_name, 1, None
+    if (item.span['class'][0] == 'color-white' or item.span['class'][0] == 'color-blue') and item_name not in WHITE_IGNORED_ITEMS:
+        return 'rw_bases', item_name + ' [eth]' if 'Ethereal' in item.text else ''.join(item_name.split('Superior ')), 1, None
+    if item.span['class'][0] == 'color-yellow':
+        return 'shrine_bases', item_name, 1, None
+    if item_name in CHARMS:
+        return 'charms', item_name, 1, None
+    shrine_match = re.search(r'Shrine \(([^\)]+)', item_name)
+    if shrine_match:
+        return 'shrines', item_name.split('(')[0].strip(), int(shrine_match.group(1)) / 10, None
+    if item_name in SHRINE_VESSELS:
+        return 'shrines', VESSEL_TO_SHRINE[item_name], int(re.search('Quantity: ([0-9]+)', item.find(class_='color-grey').text).group(1)), None
+    if item_name == 'Arcane Cluster':
+        return 'other', 'Arcane Crystal', int(re.search('Quantity: ([0-9]+)', item.find(class_='color-grey').text).group(1)), None
+    shards_match = re.search(r'Shards \(([^\)]+)', item_name)
+    if shards_match:
+        return 'other', 'Arcane Crystal', int(shards_match.group(1)) / 5, None
+    if item.span['class'][0] == 'color-orange' and item_name not in ORANGE_IGNORED_ITEMS and item_name not in TROPHIES:
+        return ('shrine_bases' if user_config['crafted_as_base'] else 'crafted'), item_name, 1, None
+    if item_name in TROPHIES:
+        return 'trophies', item_name, 1, None
+    return 'other', item_name, 1, None
+
+def classify_page_cascade(page, user_config):
+    results = []
+    for item in BeautifulSoup(page, 'html.parser').find_all(class_='item-wrapper'):
+        classification = classify_cascade(item, user_config)
+        html = str(item.parent.parent) if classification and classification[0] == 'crafted' else None
+        results.append((classification, html))
+
+    return results
+
+def classify_page_rules(page, user_config):
+    crafted_colors = ITEM_RULES.colors_for('crafted')
+    _, items = parse_armory_page([page], lambda color: color in crafted_colors)
+    results = []
+    for features in items:
+        classification = ITEM_RULES.classify(features, user_config)
+        results.append((classification, features.html if classification and classification[0] == 'crafted' else None))
+
+    return results
+
+def run(pages, classify_page, user_config):
+    results = []
+    elapsed = 0
+    for page in pages:
+        start = time.perf_counter()
+        page_results = classify_page(page, user_config)
+        elapsed += time.perf_counter() - start
+        results.append([[list(result) if result else None, html] for result, html in page_results])
+
+    return results, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages', nargs='+')
+    parser.add_argument('--golden')
+    parser.add_argument('--crafted-as-base', action='store_true')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding='utf-8') as page:
+            pages.append(page.read())
+
+    user_config = {'crafted_as_base': args.crafted_as_base}
+    cascade_time = rules_time = 0
+    for _ in range(args.rounds):
+        expected, elapsed = run(pages, classify_page_cascade, user_config)
+        cascade_time += elapsed
+        actual, elapsed = run(pages, classify_page_rules, user_config)
+        rules_time += elapsed
+
+    # The parser keeps the page's own markup, BeautifulSoup re-serializes it - compare what the image renderer will see.
+    for page in actual:
+        for result in page:
+            if result[1] is not None:
+                result[1] = str(BeautifulSoup(result[1], 'html.parser'))
+
+    if actual != expected:
+        for path, expected_page, actual_page in zip(args.pages, expected, actual):
+            for index, (old, new) in enumerate(zip(expected_page, actual_page)):
+                if old != new:
+                    print(f'{path} item #{index}: cascade {old}, rules {new}')
+            if len(expected_page) != len(actual_page):
+                print(f'{path}: cascade found {len(expected_page)} items, parser {len(actual_page)}')
+        sys.exit(1)
+
+    classifications = [[result for result, _ in page] for page in actual]
+    if args.golden:
+        if os.path.exists(args.golden):
+            with open(args.golden, encoding='utf-8') as golden:
+                if json.load(golden) != classifications:
+                    print(f'Classification differs from {args.golden}.')
+                    sys.exit(1)
+            print(f'Matches {args.golden}.')
+        else:
+            with open(args.golden, 'w', encoding='utf-8') as golden:
+                json.dump(classifications, golden, ensure_ascii=False, indent=1)
+            print(f'Saved {args.golden}.')
+
+    item_count = sum(len(page) for page in actual)
+    print(f'{item_count} items in {len(pages)} pages, {args.rounds} rounds')
+    print(f'cascade: {cascade_time / args.rounds * 1000:.2f} ms')
+    print(f'rules:   {rules_time / args.rounds * 1000:.2f} ms ({cascade_time / rules_time:.1f}x)')
@@ -0,0 +1,85 @@
+"""
+Benchmarks the crafted item image pipeline offline, uploading to a LocalImageHost in a temporary folder.
+
+Builds a dump of N crafted items with distinct tooltips and times generating its trade post with images: cold (nothing
+rendered or uploaded yet), warm (every link stored) and cold again as sprite sheets. `latency` is added to every upload
+to stand in for flickr's.
+
+Usage: python -m mxl.utils.bench_images [items=50] [latency=0.5]
+"""
+
+import asyncio
+import concurrent.futures
+import pathlib
+import sys
+import tempfile
+import time
+from mxl.cache import RenderCache
+from mxl.constants import CRAFTED_IMAGE_RENDER_WORKERS, CRAFTED_IMAGE_SHEET_SIZE
+from mxl.dclasses import ItemDump
+from mxl.hosts import LocalImageHost
+from mxl.images import ItemImages
+from mxl.links import ImageLinks
+from mxl.renderer import ItemRenderer
+
+CSS_FILE = pathlib.Path(__file__).parent.parent / 'data' / 'item_style.css'
+
+def crafted_item_html(number):
+    return (
+        '<div class="item-wrapper"><span class="color-orange">Crafted Amulet</span><img src="images/items/amulet.png">'
+        f'<div class="color-white">Required Level: {number % 140}<br><span class="color-blue">+{number} to Strength</span>'
+        f'<br><span class="color-blue">+{number % 50}% Enhanced Damage</span></div></div>'
+    )
+
+def crafted_dump(item_count):
+    dump = ItemDump()
+    for number in range(item_count):
+        dump.add('crafted', f'Crafted Amulet {number}', f'Mule{number % 10}', crafted_item_html(number))
+
+    return dump
+
+# Like the cog, the post waits for its images on its own thread, never on one of the default executor's.
+POST_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+async def timed_post(dump, user_config, renderer, render_cache, links, host, sheet_size=0):
+    started = time.perf_counter()
+    images = ItemImages(host, renderer, render_cache, links, sheet_size)
+    await images.schedule(dump.rendered_html())
+    try:
+        post, error = await asyncio.get_event_loop().run_in_executor(POST_EXECUTOR, dump.to_trade_post, user_config, images)
+    finally:
+        images.cancel()
+
+    if error is not None:
+        print(f'Generating the trade post failed: {error}')
+        sys.exit(1)
+
+    return time.perf_counter() - started, len(images.uploaded)
+
+async def main(item_count, latency):
+    dump = crafted_dump(item_count)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=CRAFTED_IMAGE_RENDER_WORKERS)
+    renderer = ItemRenderer(CSS_FILE, executor)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        links = ImageLinks(directory / 'images.db')
+        host = LocalImageHost(directory / 'hosted', 'http://localhost/images', latency)
+        user_config = {'generate_crafted_images': True, 'crafted_images_sprite_sheet': False}
+        try:
+            print(f'{item_count} crafted items, {latency:.2f}s upload latency')
+            cold_time, uploads = await timed_post(dump, user_config, renderer, RenderCache(directory / 'renders', 2 ** 30), links, host)
+            print(f'cold:   {cold_time:.2f}s, {uploads} uploads ({renderer.backend})')
+            warm_time, uploads = await timed_post(dump, user_config, renderer, RenderCache(directory / 'renders', 2 ** 30), links, host)
+            print(f'warm:   {warm_time:.2f}s, {uploads} uploads')
+            user_config['crafted_images_sprite_sheet'] = True
+            sheets_time, uploads = await timed_post(dump, user_config, renderer, RenderCache(directory / 'sheets', 2 ** 30), links, host, CRAFTED_IMAGE_SHEET_SIZE)
+            print(f'sheets: {sheets_time:.2f}s, {uploads} uploads')
+        finally:
+            await renderer.close()
+            links.close()
+            executor.shutdown()
+
+if __name__ == "__main__":
+    item_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    asyncio.get_event_loop().run_until_complete(main(item_count, latency))
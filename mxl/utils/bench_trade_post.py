@@ -0,0 +1,185 @@
+"""
+Benchmarks the trade post renderer against the old string concatenating one on a synthetic dump.
+
+Builds a dump of N random items (the item names come from the constants, amounts include fractional shrines),
+checks that both renderers produce the exact same post and prints their timings. Crafted images are not rendered.
+
+Usage: python -m mxl.utils.bench_trade_post [items=10000] [rounds=20]
+"""
+
+import random
+import sys
+import timeit
+from mxl.constants import TRADE_POST_SETS_SECTION, TRADE_POST_SU_SECTION, TRADE_POST_SSU_SECTION,\
+                          TRADE_POST_SSSU_SECTION, TRADE_POST_RUNEWORDS_SECTION, TRADE_POST_RAQMOJ_SECTION,\
+                          TRADE_POST_BASES_SECTION, TRADE_POST_CHARMS_SECTION, TRADE_POST_TROPHIES_SECTION,\
+                          TRADE_POST_MISC_SECTION, TRADE_POST_CRAFTED_SECTION, TRADE_POST_TEMPLATE,\
+                          SU_ITEMS, SSU_ITEMS, SSSU_ITEMS, SETS, RUNEWORDS, AMULETS, RINGS, JEWELS, MOS, QUIVERS, CHARMS, TROPHIES
+from mxl.dclasses import ItemDump, CATEGORIES
+
+NAMES = {
+    'su': list(SU_ITEMS),
+    'ssu': list(SSU_ITEMS),
+    'sssu': list(SSSU_ITEMS),
+    'runewords': list(RUNEWORDS),
+    'amulets': list(AMULETS),
+    'rings': list(RINGS),
+    'jewels': list(JEWELS),
+    'mos': list(MOS),
+    'quivers': list(QUIVERS),
+    'charms': list(CHARMS),
+    'trophies': list(TROPHIES)
+}
+
+def synthetic_dump(item_count, seed=0):
+    rng = random.Random(seed)
+    set_items = list(SETS.items())
+    dump = ItemDump()
+    for _ in range(item_count):
+        bucket = rng.choice(CATEGORIES.names)
+        character = f'Mule{rng.randrange(30)}'
+        if bucket == 'sets':
+            item_name, set_name = rng.choice(set_items)
+            dump.add(bucket, item_name, character, None, group=set_name)
+        elif bucket == 'shrines':
+            dump.add(bucket, f'Shrine {rng.randrange(40)}', character, None, rng.choice([1, rng.randrange(1, 10) / 10]))
+        elif bucket in NAMES:
+            dump.add(bucket, rng.choice(NAMES[bucket]), character, None)
+        else:
+            dump.add(bucket, f'{bucket} item {rng.randrange(item_count // 20 + 1)}', character, None, rng.choice([1, 1, 1, 2]))
+
+    return dump
+
+def legacy_trade_post(dump):
+    items_section = ''
+    sets_str = ''
+    for set_name, set_items in dump.groups('sets'):
+        sets_str += f'[u][color=#00FF00]{set_name}[/color][/u]\n'
+        for item in set_items:
+            sets_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+        sets_str += '\n'
+
+    if sets_str:
+        items_section += TRADE_POST_SETS_SECTION.format(items = sets_str)
+
+    su_str = ''
+    for item in dump.items('su'):
+        su_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if su_str:
+        items_section += TRADE_POST_SU_SECTION.format(items = su_str)
+
+    ssu_str = ''
+    for item in dump.items('ssu'):
+        ssu_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if ssu_str:
+        items_section += TRADE_POST_SSU_SECTION.format(items = ssu_str)
+
+    sssu_str = ''
+    for item in dump.items('sssu'):
+        sssu_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if sssu_str:
+        items_section += TRADE_POST_SSSU_SECTION.format(items = sssu_str)
+
+    runewords_str = ''
+    for item in dump.items('runewords'):
+        runewords_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if runewords_str:
+        items_section += TRADE_POST_RUNEWORDS_SECTION.format(items = runewords_str)
+
+    crafted_str = ''
+    for item in dump.items('crafted'):
+        crafted_str += f'[color=#FAAA23]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#FAAA23]{item.name}[/color]\n'
+
+    if dump.has('crafted'):
+        items_section += TRADE_POST_CRAFTED_SECTION.format(items = crafted_str)
+
+    raqmoj_str = ''
+    for item in dump.items('rings'):
+        raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if dump.has('rings'):
+        raqmoj_str += '\n'
+
+    for item in dump.items('amulets'):
+        raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if dump.has('amulets'):
+        raqmoj_str += '\n'
+
+    for item in dump.items('quivers'):
+        raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if dump.has('quivers'):
+        raqmoj_str += '\n'
+
+    for item in dump.items('mos'):
+        raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if dump.has('mos'):
+        raqmoj_str += '\n'
+
+    for item in dump.items('jewels'):
+        raqmoj_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if raqmoj_str:
+        items_section += TRADE_POST_RAQMOJ_SECTION.format(items = raqmoj_str)
+
+    bases_str = ''
+    for item in dump.items('rw_bases'):
+        bases_str += f'[color=#808080]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#808080]{item.name}[/color]\n'
+
+    for item in dump.items('shrine_bases'):
+        bases_str += f'[color=#FFFF00]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#FFFF00]{item.name}[/color]\n'
+
+    if bases_str:
+        items_section += TRADE_POST_BASES_SECTION.format(items = bases_str)
+
+    charms_str = ''
+    for item in dump.items('charms'):
+        charms_str += f'[item]{item.name}[/item] x{item.amount}\n' if item.amount > 1 else f'[item]{item.name}[/item]\n'
+
+    if charms_str:
+        items_section += TRADE_POST_CHARMS_SECTION.format(items = charms_str)
+
+    trophies_str = ''
+    for item in dump.items('trophies'):
+        trophies_str += f'[color=#FF7F50]{item.name}[/color] x{item.amount}\n' if item.amount > 1 else f'[color=#FF7F50]{item.name}[/color]\n'
+
+    if trophies_str:
+        items_section += TRADE_POST_TROPHIES_SECTION.format(items = trophies_str)
+
+    other_str = ''
+    for item in dump.items('shrines'):
+        other_str += f'[color=#FAAA23]{item.name}[/color] x{item.amount}\n' if item.amount != 1 else f'[color=#FAAA23]{item.name}[/color]\n'
+
+    if dump.has('shrines'):
+        other_str += '\n'
+
+    for item in dump.items('other'):
+        other_str += f'{item.name} x{item.amount}\n' if item.amount != 1 else f'{item.name}\n'
+
+    if other_str:
+        items_section += TRADE_POST_MISC_SECTION.format(items = other_str)
+
+    return TRADE_POST_TEMPLATE.format(items = items_section)
+
+if __name__ == "__main__":
+    item_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    dump = synthetic_dump(item_count)
+    user_config = {'generate_crafted_images': False}
+    post, _ = dump.to_trade_post(user_config)
+    if post != legacy_trade_post(dump):
+        print('Trade posts differ.')
+        sys.exit(1)
+
+    legacy_time = timeit.timeit(lambda: legacy_trade_post(dump), number=rounds) / rounds
+    sections_time = timeit.timeit(lambda: dump.to_trade_post(user_config), number=rounds) / rounds
+    print(f'{item_count} items ({len(dump)} distinct), post is {len(post)} characters, {rounds} rounds')
+    print(f'concatenation: {legacy_time * 1000:.2f} ms')
+    print(f'sections:      {sections_time * 1000:.2f} ms ({legacy_time / sections_time:.1f}x)')